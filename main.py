@@ -1,6 +1,6 @@
-from website import create_app
+from website import create_app, socketio
 
 app = create_app()
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0')
+    socketio.run(app, debug=True, host='0.0.0.0', allow_unsafe_werkzeug=True)  # Same dev server as app.run()
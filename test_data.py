@@ -6,6 +6,12 @@ from main import app
 from website import db
 from website.models import Restaurant, Customer, OrderItem, MenuItem, Order, \
     generate_restaurant_id, Review  
+from website.ratings import rebuild_ratings
+from website.categories import rebuild_categories
+from website.cards import rebuild_card_fields
+from website.accounts import rebuild_accounts
+from website.reports import rebuild_daily_stats
+from website.orders import backfill_line_snapshots
 fake = Faker('en_AU')
 
 food_categories = {
@@ -233,3 +239,9 @@ if __name__ == '__main__':
         generate_customers(20)
         generate_menu_items(6)
         generate_orders(20)
+        rebuild_ratings()
+        rebuild_categories()
+        rebuild_card_fields()
+        rebuild_accounts()
+        backfill_line_snapshots()
+        rebuild_daily_stats()
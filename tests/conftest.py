@@ -0,0 +1,38 @@
+import pytest
+
+from website import create_app, db
+from website.models import Customer, Restaurant
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+        'ORDER_EVENTS_DISPATCHER': False,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',  # Fast hashes; tests don't need the real work factor
+    })
+    # No app context is pushed here: requests would share it, and with it the test's database session
+    yield app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def sign_up(client, email, role='customer', password='password1', **fields):
+    """Signs up (and so logs in) a customer or restaurant through the sign-up form; returns its primary key."""
+    form = dict(email=email, password1=password, password2=password, role=role, name=email.split('@')[0],
+                address='1 Test Street', category='Italian')
+    form.update(fields)
+    response = client.post('/sign-up', data=form)
+    assert response.status_code == 302, response.data
+    with client.application.app_context():
+        if role == 'customer':
+            return db.session.query(Customer.customer_id).filter_by(email=email).scalar()
+        return db.session.query(Restaurant.restaurant_id).filter_by(email=email).scalar()
+
+
+def log_in(client, email, role='customer', password='password1'):
+    return client.post('/login', data=dict(email=email, password=password, user_type=role))
@@ -0,0 +1,53 @@
+import json
+
+from website import db
+from website.models import Customer
+
+
+def run_import(app, tmp_path, lines):
+    path = tmp_path / 'customers.jsonl'
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    rejects = tmp_path / 'rejects.jsonl'
+    result = app.test_cli_runner().invoke(args=[
+        'accounts', 'import', str(path), '--type', 'customer', '--batch-size', '1', '--workers', '1',
+        '--rejects', str(rejects)])
+    assert result.exit_code == 0, result.output
+    return [json.loads(line) for line in rejects.read_text(encoding='utf-8').splitlines()]
+
+
+def customer(email, **fields):
+    return json.dumps(dict({'email': email, 'password': 'password1', 'name': 'Test', 'address': '1 Test Street'},
+                           **fields))
+
+
+def imported_emails(app):
+    with app.app_context():
+        return {email for email, in db.session.query(Customer.email)}
+
+
+def test_malformed_lines_are_rejected_and_the_rest_imported(app, tmp_path):
+    rejected = run_import(app, tmp_path, [
+        customer('before@example.com'),
+        'not json',
+        '["a", "list"]',
+        customer('after@example.com'),
+    ])
+
+    assert imported_emails(app) == {'before@example.com', 'after@example.com'}
+    assert [(row['line_number'], row['reject_reason']) for row in rejected] == \
+        [(2, 'malformed JSON'), (3, 'not a JSON object')]
+
+
+def test_values_of_the_wrong_type_are_rejected(app, tmp_path):
+    rejected = run_import(app, tmp_path, [
+        customer('number-password@example.com', password=12345678),
+        customer('null-address@example.com', address=None),
+        json.dumps({'email': 42, 'password': 'password1', 'address': '1 Test Street'}),
+        customer('null-name@example.com', name=None),
+    ])
+
+    assert imported_emails(app) == {'null-name@example.com'}
+    with app.app_context():  # A missing name is stored as '', as the sign-up form would
+        assert db.session.query(Customer.name).scalar() == ''
+    assert [row['reject_reason'] for row in rejected] == ['password is not text', 'missing address',
+                                                         'email is not text']
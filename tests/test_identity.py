@@ -0,0 +1,37 @@
+from sqlalchemy import update
+
+from website import db
+from website.models import Customer, Restaurant
+
+from conftest import sign_up
+
+
+def test_cached_identity_does_not_hide_the_current_row(app, client):
+    restaurant_id = sign_up(client, 'cached@example.com', role='restaurant')
+    assert b'lastSeq = 0;' in client.get('/restaurant/dashboard').data  # Loads and caches the identity
+
+    # Another process takes two orders while this one's cache entry is still fresh
+    with app.app_context():
+        db.session.execute(update(Restaurant).where(Restaurant.restaurant_id == restaurant_id).values(event_seq=2))
+        db.session.commit()
+
+    assert b'lastSeq = 2;' in client.get('/restaurant/dashboard').data
+
+
+def test_untyped_user_id_needs_the_session_user_type(app, client):
+    restaurant_id = sign_up(client, 'legacy@example.com', role='restaurant')
+    customer_id = sign_up(app.test_client(), 'same-id@example.com')
+    with app.app_context():  # Customer and restaurant ids overlap, so a bare id is ambiguous
+        db.session.execute(update(Customer).where(Customer.customer_id == customer_id)
+                           .values(customer_id=restaurant_id))
+        db.session.commit()
+
+    with client.session_transaction() as session:
+        session['_user_id'] = str(restaurant_id)  # Issued before ids carried the account type
+    assert client.get('/restaurant/dashboard').status_code == 200
+
+    with client.session_transaction() as session:
+        del session['user_type']
+    client.delete_cookie('localhost', 'remember_token')  # Would log the user back in with a typed id
+    response = client.get('/customer/dashboard')
+    assert response.status_code == 302 and '/login' in response.headers['Location']
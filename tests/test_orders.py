@@ -0,0 +1,24 @@
+from website import db
+from website.models import MenuItem, Order
+
+from conftest import sign_up
+
+
+def test_resubmitted_checkout_returns_the_placed_order(app, client):
+    restaurant_id = sign_up(app.test_client(), 'kitchen@example.com', role='restaurant')
+    with app.app_context():
+        item = MenuItem('Soup', 'Hot', 4.5, restaurant_id, None)
+        db.session.add(item)
+        db.session.commit()
+        item_id = item.id
+
+    sign_up(client, 'diner@example.com')
+    client.post(f'/add_to_cart/{item_id}')
+    first = client.post('/checkout', data={'idempotency_key': 'form-1'})
+    # The retry arrives after the first submit emptied the cart
+    retry = client.post('/checkout', data={'idempotency_key': 'form-1'})
+
+    with app.app_context():
+        order_id, = db.session.query(Order.id).one()
+    assert first.status_code == retry.status_code == 302
+    assert first.headers['Location'] == retry.headers['Location'] == f'/order/{order_id}'
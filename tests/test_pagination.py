@@ -0,0 +1,55 @@
+import html
+import re
+
+from website import db
+from website.models import Restaurant
+
+from conftest import sign_up
+
+
+def add_restaurants(app, names):
+    with app.app_context():
+        restaurants = [Restaurant(f'r{n}@example.com', 'x', name, 'Italian', '1 Test Street')
+                       for n, name in enumerate(names)]
+        db.session.add_all(restaurants)
+        db.session.commit()
+        return [restaurant.restaurant_id for restaurant in restaurants]
+
+
+def test_api_listing_pages_through_restaurants_without_names(app, client):
+    ids = add_restaurants(app, [None, 'Bistro', None, 'Alpha', None])  # Imported rows may have no name
+    sign_up(client, 'diner@example.com')
+
+    seen, cursor = [], None
+    while True:
+        response = client.get('/api/restaurants', query_string=dict(limit=2, **({'cursor': cursor} if cursor else {})))
+        assert response.status_code == 200
+        seen += [restaurant['restaurant_id'] for restaurant in response.json['restaurants']]
+        cursor = response.json['next_cursor']
+        if not cursor:
+            break
+
+    # Nameless restaurants sort first, as '', then by id
+    assert seen == [ids[0], ids[2], ids[4], ids[3], ids[1]]
+
+
+def test_browse_page_links_to_the_next_page(app, client):
+    ids = add_restaurants(app, [None, 'Bistro', None, 'Alpha', None])
+    sign_up(client, 'diner@example.com')
+
+    seen, url = [], '/customer/restaurants?limit=2'
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        page = response.get_data(as_text=True)
+        seen += [int(restaurant_id) for restaurant_id in re.findall(r'/customer/restaurants/(\d+)"', page)]
+        next_link = re.search(r'<a href="([^"]+)" class="btn btn-outline-primary">More restaurants', page)
+        url = html.unescape(next_link.group(1)) if next_link else None
+
+    assert seen == [ids[0], ids[2], ids[4], ids[3], ids[1]]
+
+
+def test_tampered_cursor_is_a_bad_request(client):
+    sign_up(client, 'diner@example.com')
+    assert client.get('/api/restaurants?cursor=not-a-cursor').status_code == 400
+    assert client.get('/customer/restaurants?cursor=not-a-cursor').status_code == 400
@@ -0,0 +1,46 @@
+import pytest
+
+from website import db
+from website.models import Customer
+from website.passwords import HasherBusy, PasswordHasher
+
+from conftest import log_in, sign_up
+
+
+def test_hash_with_the_configured_method_needs_no_rehash():
+    hasher = PasswordHasher(method='pbkdf2:sha256')  # werkzeug stores 'pbkdf2:sha256:<default iterations>'
+    assert not hasher.needs_rehash(hasher.hash('secret'))
+    assert PasswordHasher(method='pbkdf2:sha256:1000').needs_rehash(hasher.hash('secret'))
+
+
+def test_timeout_is_busy_and_keeps_the_slot_until_the_hash_finishes():
+    hasher = PasswordHasher(method='pbkdf2:sha256:2000000', workers=1, max_queue=0, timeout=0.01)
+
+    with pytest.raises(HasherBusy):
+        hasher.hash('secret')
+    assert hasher.stats()['timed_out'] == 1
+
+    # The abandoned hash still occupies the only worker, so there is no room for another
+    with pytest.raises(HasherBusy):
+        hasher.hash('secret')
+    assert hasher.stats()['rejected'] == 1
+
+    hasher._executor.shutdown(wait=True)
+    assert hasher.stats()['pending'] == 0
+
+
+def test_login_succeeds_when_the_hasher_is_too_busy_to_upgrade_the_hash(app, client, monkeypatch):
+    sign_up(app.test_client(), 'upgrade@example.com')
+    with app.app_context():
+        hasher = PasswordHasher(method='pbkdf2:sha256:2000')  # Stronger than the stored hash, so it needs a rehash
+        app.extensions['password_hasher'] = hasher
+        stored = db.session.query(Customer.password).filter_by(email='upgrade@example.com').scalar()
+
+    def busy(password):
+        raise HasherBusy()
+    monkeypatch.setattr(hasher, 'hash', busy)
+
+    response = log_in(client, 'upgrade@example.com')
+    assert response.status_code == 302
+    with app.app_context():
+        assert db.session.query(Customer.password).filter_by(email='upgrade@example.com').scalar() == stored
@@ -0,0 +1,51 @@
+from datetime import date
+
+from website import db
+from website.models import MenuItem, Order
+from website.reports import rebuild_daily_stats, revenue_report
+
+from conftest import sign_up
+
+
+def rollups(restaurant_id):
+    totals, revenue_by_item = revenue_report(restaurant_id, date(2000, 1, 1), date(2100, 1, 1))
+    return totals, sorted(tuple(row) for row in revenue_by_item)
+
+
+def test_status_change_after_menu_item_deletion(app, client):
+    restaurant = app.test_client()
+    restaurant_id = sign_up(restaurant, 'kitchen@example.com', role='restaurant')
+    with app.app_context():
+        items = [MenuItem('Soup', 'Hot', 4.5, restaurant_id, None),
+                 MenuItem('Bread', 'Fresh', 2.0, restaurant_id, None)]
+        db.session.add_all(items)
+        db.session.commit()
+        soup_id, bread_id = [item.id for item in items]
+
+    sign_up(client, 'diner@example.com')
+    for menu_item_id in (soup_id, soup_id, bread_id):
+        client.post(f'/add_to_cart/{menu_item_id}')
+    assert client.post(f'/create-order/{restaurant_id}').status_code == 302
+    with app.app_context():
+        order_id = db.session.query(Order.id).scalar()
+        totals, revenue_by_item = rollups(restaurant_id)
+        assert totals['order_count'] == 1 and revenue_by_item == [('Bread', 2.0), ('Soup', 9.0)]
+
+    assert restaurant.post(f'/restaurant/menu/delete/{soup_id}').status_code == 302
+    assert restaurant.post(f'/restaurant/orders/reject/{order_id}').status_code == 302
+    with app.app_context():
+        incremental = rollups(restaurant_id)
+        assert incremental[0]['order_count'] == 0 and incremental[1] == []
+
+        rebuild_daily_stats()
+        assert rollups(restaurant_id) == incremental
+
+    # Accepting it again (a status change back into revenue) restores the deleted item under its name
+    assert restaurant.post(f'/restaurant/orders/update_status/{order_id}',
+                           data={'new_status': 'Accepted'}).status_code == 302
+    with app.app_context():
+        incremental = rollups(restaurant_id)
+        assert incremental[1] == [('Bread', 2.0), ('Soup', 9.0)]
+
+        rebuild_daily_stats()
+        assert rollups(restaurant_id) == incremental
@@ -0,0 +1,39 @@
+from website import db
+from website.models import ServerSession
+from website.sessions import _session_id
+
+from conftest import log_in, sign_up
+
+
+def session_cookie(client):
+    return next((cookie.value for cookie in client.cookie_jar if cookie.name == 'session'), None)
+
+
+def test_login_issues_a_new_session_token(app, client):
+    sign_up(client, 'fixation@example.com')
+    client.get('/logout')
+
+    # A session started before login, e.g. one an attacker planted in the victim's browser
+    with client.session_transaction() as session:
+        session['cart'] = {'1': 2}
+    planted = session_cookie(client)
+    assert planted
+
+    assert log_in(client, 'fixation@example.com').status_code == 302
+    token = session_cookie(client)
+    assert token and token != planted
+    with app.app_context():
+        assert db.session.get(ServerSession, _session_id(planted)) is None
+
+    with client.session_transaction() as session:
+        assert session['cart'] == {'1': 2}  # The contents move to the new token
+
+
+def test_logout_issues_a_new_session_token(app, client):
+    sign_up(client, 'logout@example.com')
+    logged_in = session_cookie(client)
+
+    client.get('/logout')
+    assert session_cookie(client) != logged_in
+    with app.app_context():
+        assert db.session.get(ServerSession, _session_id(logged_in)) is None
@@ -0,0 +1,22 @@
+from website import db
+from website.models import Restaurant
+
+from conftest import sign_up
+
+
+def test_second_restaurant_gets_its_own_id(app):
+    first = sign_up(app.test_client(), 'first@example.com', role='restaurant')
+    second = sign_up(app.test_client(), 'second@example.com', role='restaurant')
+
+    assert first != second
+    with app.app_context():
+        assert db.session.query(Restaurant.email).order_by(Restaurant.restaurant_id).all() == \
+            [('first@example.com',), ('second@example.com',)]
+
+
+def test_duplicate_email_is_reported(app, client):
+    sign_up(app.test_client(), 'taken@example.com', role='restaurant')
+    response = client.post('/sign-up', data=dict(email='Taken@Example.com', password1='password1',
+                                                 password2='password1', role='customer', name='taken',
+                                                 address='1 Test Street'))
+    assert response.status_code == 200 and b'Email already exists.' in response.data
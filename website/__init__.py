@@ -6,30 +6,90 @@ from flask_login import LoginManager, current_user
 from flask_socketio import SocketIO
 
 db = SQLAlchemy()
+socketio = SocketIO()
 DB_NAME = "database.db"
-from .models import BaseUser, Customer, Restaurant, MenuItem, OrderItem, Order
+from .models import BaseUser, Customer, Restaurant, MenuItem, OrderItem, Order, GeocodeCache, Category, \
+    ServerSession, OrderEvent, Account, RestaurantDailyStats, RestaurantDailyItemStats
 
 global latest_restaurant_id
 latest_restaurant_id = 98
 
 
-def create_app():
+def create_app(test_config=None):
     app = Flask(__name__)
     app.config['SECRET_KEY'] = 'dasher dasher'
     app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_NAME}'
+    app.config['GEOCODER'] = 'offline'  # Or 'nominatim' (see geo.py)
+    app.config['FEATURED_COUNT'] = 3
+    app.config['FEATURED_REFRESH_SECONDS'] = 300
+    app.config['CACHE_BACKEND'] = 'memory'  # Or 'redis', shared by all workers (needs CACHE_REDIS_URL)
+    app.config['CACHE_MAX_ENTRIES'] = 1024
+    app.config['CACHE_DEFAULT_TTL'] = 600
+    app.config['FRAGMENT_CACHE_MAX_BYTES'] = 8 * 1024 * 1024
+    app.config['FRAGMENT_CACHE_TTL'] = 3600
+    app.config['SESSION_BACKEND'] = 'sql'  # Or 'memory' for tests (see sessions.py)
+    app.config['SESSION_IDLE_TTL'] = 14 * 24 * 3600
+    app.config['ORDER_EVENTS_DISPATCHER'] = True  # Background delivery of the order_events outbox
+    app.config['ORDER_EVENTS_BATCH_SIZE'] = 100
+    app.config['ORDER_EVENTS_POLL_SECONDS'] = 2.0
+    app.config['EVENT_LOG_SIZE'] = 500  # Order events kept per restaurant for reconnect replay
+    app.config['EVENT_REPLAY_LIMIT'] = 100  # Larger gaps get a snapshot instead
+    app.config['IDENTITY_CACHE_TTL'] = 30  # Seconds load_user() may reuse an account row; 0 disables
+    app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:600000'  # Older hashes are upgraded at login
+    app.config['PASSWORD_HASH_WORKERS'] = 4
+    app.config['PASSWORD_HASH_MAX_QUEUE'] = 64
+    if test_config is not None:
+        app.config.update(test_config)
     db.init_app(app)
 
     from .views import views
     from .auth import auth
+    from .ratings import ratings_cli
+    from .search import search_cli
+    from .geo import geo_cli
+    from .categories import categories_cli
+    from .cards import cards_cli
+    from .sessions import sessions_cli, init_sessions
+    from .orders import orders_cli
+    from .outbox import events_cli, init_outbox
+    from .passwords import passwords_cli
+    from .accounts import accounts_cli
+    from .reports import reports_cli
 
     app.register_blueprint(views, url_prefix='/')
     app.register_blueprint(auth, url_prefix='/')
 
+    app.cli.add_command(ratings_cli)
+    app.cli.add_command(search_cli)
+    app.cli.add_command(geo_cli)
+    app.cli.add_command(categories_cli)
+    app.cli.add_command(cards_cli)
+    app.cli.add_command(sessions_cli)
+    app.cli.add_command(orders_cli)
+    app.cli.add_command(events_cli)
+    app.cli.add_command(passwords_cli)
+    app.cli.add_command(accounts_cli)
+    app.cli.add_command(reports_cli)
+
+    init_sessions(app)
+    init_outbox(app)
+
+    from .fragment_cache import init_fragment_cache
+    init_fragment_cache(app)
+
     UPLOAD_FOLDER = 'website/static/images'  # Relative path within the project directory
     app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
     with app.app_context():
+        from .schema import upgrade_schema
+        from .search import ensure_search_index
+        from .categories import ensure_categories
+        from .accounts import ensure_accounts
         db.create_all()
+        upgrade_schema(db)
+        ensure_search_index()
+        ensure_categories()
+        ensure_accounts()
 
     if not os.path.exists(app.config['UPLOAD_FOLDER']):
         os.makedirs(app.config['UPLOAD_FOLDER'])
@@ -40,15 +100,14 @@ def create_app():
 
     @login_manager.user_loader
     def load_user(id):
-        user = Customer.query.get(int(id))  # First try finding the user as a Customer
-        if not user:
-            user = Restaurant.query.get(int(id))  # If not found, check the Restaurant table
-        return user
+        from .identity import load_identity
+        return load_identity(id)  # One primary-key lookup (or none, from the identity cache)
 
     @app.context_processor
     def inject_flask_login():
         return dict(current_user=current_user)
 
-    socketio = SocketIO(app)
+    from . import realtime  # Registers the Socket.IO event handlers
+    socketio.init_app(app)
 
     return app
@@ -0,0 +1,273 @@
+import csv
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import and_, insert, select
+from werkzeug.security import generate_password_hash
+
+from . import db
+from .categories import category_names, rebuild_categories
+from .models import Account, Customer, Restaurant
+from .search import index_restaurant
+
+accounts_cli = AppGroup('accounts', help='Maintain the email index over customer and restaurant accounts.')
+
+ACCOUNT_MODELS = {'customer': Customer, 'restaurant': Restaurant}
+
+
+def normalise_email(email):
+    return (email or '').strip().lower()
+
+
+def email_exists(email):
+    """True if any customer or restaurant uses the email, ignoring case."""
+    return db.session.get(Account, normalise_email(email)) is not None
+
+
+def find_user_by_email(email, account_type=None):
+    """The customer or restaurant with this email (ignoring case), optionally only of the given type, or None."""
+    email = normalise_email(email)
+    if account_type is None:
+        account = db.session.get(Account, email)
+        if account is None:
+            return None
+        return db.session.get(ACCOUNT_MODELS[account.account_type], account.account_id)
+
+    model = ACCOUNT_MODELS.get(account_type)
+    if model is None:
+        return None
+    # One query: the accounts index joined to the owning table by primary key
+    return model.query \
+        .join(Account, and_(Account.account_type == account_type,
+                            Account.account_id == model.__mapper__.primary_key[0])) \
+        .filter(Account.email == email) \
+        .first()
+
+
+def register_account(user):
+    """Adds the user's email to the accounts index in the caller's transaction.
+
+    The user must have been flushed so that it has an id. Flushing raises IntegrityError if another account
+    already has the email.
+    """
+    account_type = user.type
+    account_id = user.customer_id if account_type == 'customer' else user.restaurant_id
+    db.session.add(Account(email=normalise_email(user.email), account_type=account_type, account_id=account_id))
+    db.session.flush()
+
+
+def ensure_accounts():
+    """Builds the accounts index on first run for databases created before it existed."""
+    if db.session.query(Account.email).first() is not None:
+        return
+    if db.session.query(Customer.customer_id).first() is None and \
+            db.session.query(Restaurant.restaurant_id).first() is None:
+        return
+    rebuild_accounts()
+
+
+def rebuild_accounts():
+    """Re-creates the accounts index from the customers and restaurants tables.
+
+    Returns (indexed, duplicates): emails used by more than one account are indexed for the first one found
+    (customers first) and counted as duplicates.
+    """
+    Account.query.delete()
+    seen = set()
+    duplicates = 0
+    for account_type, model in ACCOUNT_MODELS.items():
+        primary_key = model.__mapper__.primary_key[0]
+        for account_id, email in db.session.query(primary_key, model.email).order_by(primary_key):
+            email = normalise_email(email)
+            if email in seen:
+                duplicates += 1
+                continue
+            seen.add(email)
+            db.session.add(Account(email=email, account_type=account_type, account_id=account_id))
+    db.session.commit()
+    return len(seen), duplicates
+
+
+@accounts_cli.command('rebuild')
+def rebuild_command():
+    """Rebuild the email index from the customers and restaurants tables."""
+    indexed, duplicates = rebuild_accounts()
+    click.echo(f'Indexed {indexed} account emails.')
+    if duplicates:
+        click.echo(f'{duplicates} accounts share an email with an earlier account and cannot sign in by email.',
+                   err=True)
+
+
+# --- Bulk import ---
+
+IMPORT_FIELDS = ('email', 'password', 'password_hash', 'name', 'address', 'category', 'membership_type')
+
+
+def _read_rows(path, file_format):
+    """Yields (row, reason) per CSV row or JSON line: a dict and None, or the raw line and why it can't be read."""
+    if file_format == 'auto':
+        file_format = 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+    with open(path, newline='', encoding='utf-8') as file:
+        if file_format == 'csv':
+            for row in csv.DictReader(file):
+                yield row, None
+        else:
+            for line_number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    yield {'line_number': line_number, 'raw': line.rstrip('\n')}, 'malformed JSON'
+                    continue
+                if isinstance(row, dict):
+                    yield row, None
+                else:
+                    yield {'line_number': line_number, 'raw': line.rstrip('\n')}, 'not a JSON object'
+
+
+def _hash_password(args):
+    # Runs in a worker process
+    password, method = args
+    return generate_password_hash(password, method=method)
+
+
+def _validate(row, account_type, categories):
+    """Returns the reason a row can't be imported, or None."""
+    for field in IMPORT_FIELDS:
+        if row.get(field) is not None and not isinstance(row[field], str):
+            return f'{field} is not text'
+    email = normalise_email(row.get('email'))
+    if len(email) < 4 or '@' not in email:
+        return 'invalid email'
+    if not row.get('password_hash') and len(row.get('password') or '') < 7:
+        return 'password too short'
+    if not row.get('address'):
+        return 'missing address'
+    if account_type == 'restaurant' and row.get('category') not in categories:
+        return 'unknown category'
+    return None
+
+
+def _import_batch(rows, account_type, pool, method):
+    """Hashes passwords in the pool, then inserts the accounts and their index rows with executemany.
+
+    Returns the new restaurant ids (empty for customers).
+    """
+    needs_hash = [row for row in rows if not row.get('password_hash')]
+    for row, password_hash in zip(needs_hash, pool.map(_hash_password,
+                                                        [(row['password'], method) for row in needs_hash],
+                                                        chunksize=max(1, len(needs_hash) // 32))):
+        row['password_hash'] = password_hash
+
+    model = ACCOUNT_MODELS[account_type]
+    values = []
+    for row in rows:
+        value = {'email': row['email'].strip(), 'password': row['password_hash'], 'name': row.get('name') or '',
+                 'address': row['address'], 'type': account_type}
+        if account_type == 'customer':
+            membership_type = row.get('membership_type') or None
+            value.update(membership=membership_type in ('monthly', 'annual'), membership_type=membership_type)
+        else:
+            value['category'] = row['category']
+        values.append(value)
+    db.session.execute(insert(model.__table__), values)
+
+    primary_key = model.__mapper__.primary_key[0]
+    created = db.session.execute(select(primary_key, model.email)
+                                 .where(model.email.in_([value['email'] for value in values]))).all()
+    db.session.execute(insert(Account.__table__), [
+        {'email': normalise_email(email), 'account_type': account_type, 'account_id': account_id}
+        for account_id, email in created
+    ])
+    return [account_id for account_id, _ in created] if account_type == 'restaurant' else []
+
+
+@accounts_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--type', 'account_type', type=click.Choice(['customer', 'restaurant']), required=True)
+@click.option('--format', 'file_format', type=click.Choice(['auto', 'csv', 'jsonl']), default='auto',
+              show_default=True)
+@click.option('--batch-size', default=1000, show_default=True, help='Rows validated and inserted per transaction.')
+@click.option('--workers', default=os.cpu_count() or 1, show_default=True, help='Password hashing processes.')
+@click.option('--rejects', type=click.Path(dir_okay=False, writable=True),
+              help='Write rejected rows here as JSON lines, with the reason.')
+def import_command(path, account_type, file_format, batch_size, workers, rejects):
+    """Import customers or restaurants from a CSV or JSONL file.
+
+    Columns: email, password (or an existing werkzeug password_hash), name, address, plus category for
+    restaurants and optionally membership_type ('monthly' or 'annual') for customers. Rows whose email is
+    already taken, in the database or earlier in the file, are rejected.
+    """
+    method = current_app.config.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
+    categories = set(category_names()) if account_type == 'restaurant' else set()
+    reasons = Counter()
+    seen = set()
+    imported = 0
+    restaurant_ids = []
+    rejects_file = open(rejects, 'w', encoding='utf-8') if rejects else None
+    started = time.perf_counter()
+
+    def reject(row, reason):
+        reasons[reason] += 1
+        if rejects_file:
+            rejects_file.write(json.dumps(dict(row, reject_reason=reason)) + '\n')
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rows = _read_rows(path, file_format)
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+
+                valid = []
+                for row, reason in batch:
+                    if reason is None:
+                        reason = _validate(row, account_type, categories)
+                    if reason is None and normalise_email(row['email']) in seen:
+                        reason = 'duplicate email in file'
+                    if reason:
+                        reject(row, reason)
+                        continue
+                    seen.add(normalise_email(row['email']))
+                    valid.append(row)
+
+                # One query per batch against the email index
+                taken = set(db.session.execute(select(Account.email).where(
+                    Account.email.in_([normalise_email(row['email']) for row in valid]))).scalars())
+                for row in [row for row in valid if normalise_email(row['email']) in taken]:
+                    reject(row, 'email already registered')
+                valid = [row for row in valid if normalise_email(row['email']) not in taken]
+
+                if valid:
+                    restaurant_ids += _import_batch(valid, account_type, pool, method)
+                    db.session.commit()
+                    imported += len(valid)
+                elapsed = time.perf_counter() - started
+                click.echo(f'{imported} imported, {sum(reasons.values())} rejected '
+                           f'({imported / elapsed:.0f} accounts/s)')
+    finally:
+        if rejects_file:
+            rejects_file.close()
+
+    if restaurant_ids:
+        for restaurant_id in restaurant_ids:
+            index_restaurant(restaurant_id)
+        db.session.commit()
+        rebuild_categories()
+
+    elapsed = time.perf_counter() - started
+    click.echo(f'Imported {imported} {account_type} accounts in {elapsed:.1f}s '
+               f'({imported / elapsed:.0f} accounts/s).')
+    for reason, count in reasons.most_common():
+        click.echo(f'  rejected {count}: {reason}')
+    if imported:
+        click.echo("Run 'flask geo backfill' to geocode the new addresses.")
@@ -1,35 +1,53 @@
 from functools import wraps
+from sqlalchemy.exc import IntegrityError
 from flask import Blueprint, render_template, request, flash, redirect, url_for, abort, session
 from .models import BaseUser, Customer, Restaurant, generate_restaurant_id
 from . import db, latest_restaurant_id
-from werkzeug.security import generate_password_hash, check_password_hash
+from .search import index_restaurant
+from .geo import locate
+from .categories import category_names, is_valid_category, record_category_change, invalidate_categories
+from .sessions import adopt_saved_cart, regenerate_session
+from .identity import invalidate_identity
+from .passwords import get_password_hasher, HasherBusy
+from .accounts import email_exists, find_user_by_email, register_account
 from flask_login import login_user, login_required, logout_user, current_user
 
 auth = Blueprint('auth', __name__)
 
 
-def find_user_by_email(email):
-    """Retrieves the user object (customer or restaurant) based on email."""
-    return Customer.query.filter_by(email=email).first() or Restaurant.query.filter_by(email=email).first()
-
-
 @auth.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         email = request.form.get('email')
         password = request.form.get('password')
         user_type = request.form.get('user_type')
+        hasher = get_password_hasher()
 
-        if user_type == 'customer':
-            user = Customer.query.filter_by(email=email).first()
-        elif user_type == 'restaurant':
-            user = Restaurant.query.filter_by(email=email).first()
+        if user_type in ('customer', 'restaurant'):
+            user = find_user_by_email(email, user_type)
         else:
             # Handle invalid user type
             flash('Invalid user type.', category='error')
             return render_template("login.html")
 
-        if user and check_password_hash(user.password, password):
+        try:
+            verified = user is not None and hasher.verify(user.password, password)
+        except HasherBusy:
+            flash('We are handling a lot of sign-ins right now. Please try again in a moment.', category='error')
+            return render_template("login.html"), 503
+
+        if verified:
+            if hasher.needs_rehash(user.password):
+                # Upgrade the stored hash to the configured method and work factor while we have the password;
+                # best-effort, a busy hasher leaves it for the next login
+                try:
+                    user.password = hasher.hash(password)
+                except HasherBusy:
+                    pass
+                else:
+                    db.session.commit()
+                    invalidate_identity(user)
+
             # Use nested if/elif to set user_id based on type
             if user_type == 'customer':
                 user_id = user.customer_id
@@ -39,8 +57,11 @@ def login():
                 # Shouldn't reach here, but handle unexpected case
                 user_id = None
 
+            regenerate_session(session)
             login_user(user, remember=True)# Pass user ID instead of user object
             session['user_type'] = user_type
+            if user_type == 'customer':
+                adopt_saved_cart(session, user_id)  # Pick up a cart started on another device
             flash('Logged in successfully!', category='success')
 
             # Redirect based on user type
@@ -81,23 +102,10 @@ def restaurant_required(func):
 @login_required
 def logout():
     logout_user()
+    regenerate_session(session)
     return redirect(url_for('auth.login'))
 
 
-def email_exists(email):
-    customer = db.session.query(Customer).filter_by(email=email).first()
-    if customer:
-        return True
-
-    restaurant = db.session.query(Restaurant).filter_by(email=email).first()
-    if restaurant:
-        return True
-
-    return False
-
-
-
-
 @auth.route('/sign-up', methods=['GET', 'POST'])
 def sign_up():
     if request.method == 'POST':
@@ -116,25 +124,47 @@ def sign_up():
             flash('Passwords do not match.', category='error')
         elif role not in ['customer', 'restaurant']:
             flash('Invalid role selected.', category='error')
+        elif role == 'restaurant' and not is_valid_category(request.form.get('category')):
+            flash('Please choose a category for your restaurant.', category='error')
         else:
-            password_hash = generate_password_hash(password1, method='pbkdf2:sha256')
-            if role == 'customer':
-                new_user = Customer(email=email, password=password_hash, name=request.form.get('name'),
-                                    address=request.form.get('address'))  # Set type
-                db.session.add(new_user)
-                db.session.commit()
-            elif role == 'restaurant':
-                new_user = Restaurant(email=email, password=password_hash, name=request.form.get('name'),
-                                      category=request.form.get('category'), address=request.form.get('address'), )  # Set type
-                latest_restaurant_id = 99
-                new_user.restaurant_id = latest_restaurant_id + 1
-                latest_restaurant_id += 1
-                db.session.add(new_user)
-                db.session.commit()
-
+            try:
+                password_hash = get_password_hasher().hash(password1)
+            except HasherBusy:
+                flash('We are handling a lot of sign-ups right now. Please try again in a moment.', category='error')
+                return render_template('sign_up.html', categories=category_names()), 503
+            try:
+                if role == 'customer':
+                    new_user = Customer(email=email, password=password_hash, name=request.form.get('name'),
+                                        address=request.form.get('address'))  # Set type
+                    locate(new_user)
+                    db.session.add(new_user)
+                    db.session.flush()
+                    register_account(new_user)
+                    db.session.commit()
+                elif role == 'restaurant':
+                    new_user = Restaurant(email=email, password=password_hash, name=request.form.get('name'),
+                                          category=request.form.get('category'),
+                                          address=request.form.get('address'), )  # Set type
+                    locate(new_user)
+                    db.session.add(new_user)
+                    db.session.flush()
+                    register_account(new_user)
+                    index_restaurant(new_user.restaurant_id)
+                    record_category_change(None, new_user.category)
+                    db.session.commit()
+                    invalidate_categories()
+            except IntegrityError:
+                db.session.rollback()
+                if email_exists(email):  # Someone signed up with the same email in the meantime
+                    flash("Email already exists.", category="error")
+                else:
+                    flash('An error occurred while creating your account. Please try again.', category='error')
+                return render_template('sign_up.html', categories=category_names())
+
+            regenerate_session(session)
             login_user(new_user, remember=True)
             session['user_type'] = role  # Set user type in session
             flash('Account created.', category='success')
             return redirect(url_for('views.home'))
 
-    return render_template('sign_up.html')
+    return render_template('sign_up.html', categories=category_names())
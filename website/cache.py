@@ -0,0 +1,120 @@
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+
+class MemoryCache:
+    """Thread-safe in-process LRU cache bounded by entry count (and optionally total size), with per-entry TTLs."""
+
+    def __init__(self, max_entries=1024, default_ttl=600, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value, size)
+        self._lock = threading.Lock()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (ttl or self.default_ttl)
+        size = sys.getsizeof(value) if self.max_bytes else 0
+        if self.max_bytes and size > self.max_bytes:
+            return  # Would evict everything else and still not fit
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (expires_at, value, size)
+            self.size_bytes += size
+            while len(self._entries) > self.max_entries or (self.max_bytes and self.size_bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def stats(self):
+        return {'entries': len(self._entries), 'size_bytes': self.size_bytes, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size_bytes -= entry[2]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCache:
+    """Cache shared by every worker process, backed by Redis. Values must be JSON-serialisable."""
+
+    def __init__(self, url, default_ttl=600, prefix='dasher:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_BACKEND = 'redis' requires the redis package (pip install redis)")
+        self._client = redis.Redis.from_url(url)
+        self.default_ttl = default_ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        raw = self._client.get(self.prefix + key)
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        self._client.set(self.prefix + key, json.dumps(value), ex=int(ttl or self.default_ttl))
+
+    def delete(self, key):
+        self._client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self._client.scan_iter(self.prefix + '*'):
+            self._client.delete(key)
+
+
+def create_cache(config):
+    """Builds the cache backend selected by CACHE_BACKEND ('memory' or 'redis')."""
+    backend = config.get('CACHE_BACKEND', 'memory')
+    ttl = config.get('CACHE_DEFAULT_TTL', 600)
+    if backend == 'memory':
+        return MemoryCache(max_entries=config.get('CACHE_MAX_ENTRIES', 1024), default_ttl=ttl)
+    if backend == 'redis':
+        return RedisCache(config['CACHE_REDIS_URL'], default_ttl=ttl)
+    raise ValueError(f'Unknown cache backend: {backend}')
+
+
+def get_cache():
+    """The app's cache backend, created on first use."""
+    cache = current_app.extensions.get('cache')
+    if cache is None:
+        cache = current_app.extensions['cache'] = create_cache(current_app.config)
+    return cache
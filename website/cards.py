@@ -0,0 +1,61 @@
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func, update
+
+from . import db
+from .catalogue import bump_all_content_versions
+from .models import Restaurant, MenuItem
+
+cards_cli = AppGroup('cards', help='Maintain the denormalized restaurant card fields.')
+
+
+def refresh_card_fields(restaurant_id):
+    """Recomputes one restaurant's cover image, item count and prices from its menu, in the caller's transaction."""
+    count, min_price, avg_price = db.session.query(
+        func.count(MenuItem.id), func.min(MenuItem.price), func.avg(MenuItem.price)
+    ).filter(MenuItem.restaurant_id == restaurant_id).one()
+    cover_image_path = db.session.query(MenuItem.image_path) \
+        .filter(MenuItem.restaurant_id == restaurant_id, MenuItem.image_path.isnot(None)) \
+        .order_by(MenuItem.id).limit(1).scalar()
+
+    db.session.execute(
+        update(Restaurant)
+        .where(Restaurant.restaurant_id == restaurant_id)
+        .values(cover_image_path=cover_image_path, menu_item_count=count,
+                min_item_price=min_price, avg_item_price=avg_price)
+    )
+
+
+def rebuild_card_fields():
+    """Recomputes the card fields of every restaurant. Returns the number of restaurants updated."""
+    stats = {
+        restaurant_id: (count, min_price, avg_price)
+        for restaurant_id, count, min_price, avg_price in db.session.query(
+            MenuItem.restaurant_id, func.count(MenuItem.id), func.min(MenuItem.price), func.avg(MenuItem.price)
+        ).group_by(MenuItem.restaurant_id)
+    }
+    first_item_ids = db.session.query(func.min(MenuItem.id)) \
+        .filter(MenuItem.image_path.isnot(None)) \
+        .group_by(MenuItem.restaurant_id)
+    covers = dict(db.session.query(MenuItem.restaurant_id, MenuItem.image_path)
+                  .filter(MenuItem.id.in_(first_item_ids)))
+
+    restaurants = Restaurant.query.all()
+    for restaurant in restaurants:
+        count, min_price, avg_price = stats.get(restaurant.restaurant_id, (0, None, None))
+        restaurant.cover_image_path = covers.get(restaurant.restaurant_id)
+        restaurant.menu_item_count = count
+        restaurant.min_item_price = min_price
+        restaurant.avg_item_price = avg_price
+
+    db.session.flush()
+    bump_all_content_versions()
+    db.session.commit()
+    return len(restaurants)
+
+
+@cards_cli.command('rebuild')
+def rebuild_command():
+    """Recompute cover images, menu item counts and prices for every restaurant."""
+    count = rebuild_card_fields()
+    click.echo(f'Rebuilt card fields for {count} restaurants.')
@@ -0,0 +1,75 @@
+from collections import namedtuple
+
+from flask import g, session
+
+from .models import MenuItem
+
+MEMBERSHIP_DISCOUNT = 0.10  # Members get 10% off every order
+
+CartLine = namedtuple('CartLine', ['menu_item', 'quantity', 'line_total', 'discounted_total'])
+
+
+class PricedCart:
+    """A cart resolved against current menu prices."""
+
+    def __init__(self, lines, member):
+        self.lines = lines
+        self.member = member
+        self.subtotal = round(sum(line.line_total for line in lines), 2)
+        self.discount = round(self.subtotal * MEMBERSHIP_DISCOUNT, 2) if member else 0.0
+        self.total = round(self.subtotal - self.discount, 2)
+
+    @property
+    def is_empty(self):
+        return not self.lines
+
+    @property
+    def restaurant_id(self):
+        return self.lines[0].menu_item.restaurant_id if self.lines else None
+
+    @property
+    def service_option(self):
+        return "Membership" if self.member else "Pay-on-Demand"
+
+
+class CartService:
+    """Prices a {menu_item_id: quantity} cart with a single IN query."""
+
+    def __init__(self, contents, member=False):
+        self.contents = contents or {}
+        self.member = bool(member)
+
+    def price(self):
+        quantities = {}
+        for menu_item_id, quantity in self.contents.items():
+            try:
+                menu_item_id, quantity = int(menu_item_id), int(quantity)
+            except (TypeError, ValueError):
+                continue
+            if quantity > 0:
+                quantities[menu_item_id] = quantity
+
+        menu_items = {}
+        if quantities:
+            menu_items = {item.id: item for item in MenuItem.query.filter(MenuItem.id.in_(quantities))}
+
+        lines = []
+        for menu_item_id, quantity in quantities.items():  # Keep the order items were added in
+            menu_item = menu_items.get(menu_item_id)
+            if menu_item is None:
+                continue  # Deleted from the menu since it was added to the cart
+            line_total = round(menu_item.price * quantity, 2)
+            discounted_total = round(line_total * (1 - MEMBERSHIP_DISCOUNT), 2) if self.member else line_total
+            lines.append(CartLine(menu_item, quantity, line_total, discounted_total))
+        return PricedCart(lines, self.member)
+
+
+def current_cart(customer):
+    """The customer's priced cart, computed at most once per request for the same cart contents."""
+    contents = session.get('cart') or {}
+    memo_key = (customer.customer_id, bool(customer.membership), tuple(sorted(contents.items())))
+    memo = g.get('_priced_cart')
+    if memo is None or memo[0] != memo_key:
+        memo = (memo_key, CartService(contents, customer.membership).price())
+        g._priced_cart = memo
+    return memo[1]
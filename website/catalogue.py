@@ -0,0 +1,78 @@
+from datetime import datetime
+
+from sqlalchemy import func, update
+
+from . import db
+from .cache import get_cache
+from .models import Restaurant, MenuItem
+
+
+def bump_content_version(restaurant_id):
+    """Marks a restaurant's customer-facing content as changed, in the caller's transaction.
+
+    Cached entries are keyed by the version, so anything cached for the old version is never read again.
+    """
+    db.session.execute(
+        update(Restaurant)
+        .where(Restaurant.restaurant_id == restaurant_id)
+        .values(content_version=Restaurant.content_version + 1, content_updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def bump_all_content_versions():
+    """Marks every restaurant as changed, for bulk rebuilds of data shown on the catalogue pages."""
+    db.session.execute(
+        update(Restaurant)
+        .values(content_version=Restaurant.content_version + 1, content_updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def content_state(restaurant_id):
+    """The restaurant's (content_version, content_updated_at) from a primary key lookup, or None."""
+    return db.session.query(Restaurant.content_version, Restaurant.content_updated_at) \
+        .filter(Restaurant.restaurant_id == restaurant_id).first()
+
+
+def catalogue_state():
+    """(last change, restaurant count) across the whole catalogue, for validating listing pages.
+
+    Both come from indexes: MAX() over content_updated_at and COUNT() over the primary key.
+    """
+    return db.session.query(func.max(Restaurant.content_updated_at), func.count(Restaurant.restaurant_id)).one()
+
+
+def restaurant_detail(restaurant_id, version):
+    """Read-through cached view model for the restaurant detail page."""
+    cache = get_cache()
+    key = f'restaurant_detail:{restaurant_id}:{version}'
+    detail = cache.get(key)
+    if detail is None:
+        detail = build_restaurant_detail(restaurant_id)
+        cache.set(key, detail)
+    return detail
+
+
+def build_restaurant_detail(restaurant_id):
+    restaurant = db.session.get(Restaurant, restaurant_id)
+    menu_items = MenuItem.query.filter_by(restaurant_id=restaurant_id).order_by(MenuItem.id).all()
+    return {
+        'restaurant': {
+            'restaurant_id': restaurant.restaurant_id,
+            'content_version': restaurant.content_version,
+            'name': restaurant.name,
+            'category': restaurant.category,
+            'address': restaurant.address,
+            'average_rating': restaurant.average_rating if restaurant.review_count else 0,
+            'review_count': restaurant.review_count,
+            'rating_histogram': {str(stars): count for stars, count in restaurant.rating_histogram.items()},
+        },
+        'menu_items': [{
+            'id': item.id,
+            'name': item.name,
+            'description': item.description,
+            'price': item.price,
+            'image_path': item.image_path,
+        } for item in menu_items],
+    }
@@ -0,0 +1,117 @@
+import threading
+import time
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func, update
+
+from . import db
+from .catalogue import bump_all_content_versions
+from .models import Category, Restaurant
+
+categories_cli = AppGroup('categories', help='Maintain the restaurant category taxonomy.')
+
+DEFAULT_CATEGORIES = ['American', 'Breakfast', 'Cafe', 'Chinese', 'Club', 'Dessert', 'Greek', 'Indian', 'Italian',
+                      'Japanese', 'Korean', 'Lebanese', 'Mexican', 'Thai']
+
+
+class CategoryCache:
+    """In-process copy of the categories table.
+
+    Writers bump the version after committing a change; readers reload when their copy is from an older version.
+    The TTL bounds how long another worker process can serve a stale list.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self.version = 0
+        self._loaded_version = -1
+        self._expires_at = 0.0
+        self._categories = []  # [(name, restaurant_count)] sorted by name
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._loaded_version != self.version or time.monotonic() >= self._expires_at:
+            with self._lock:
+                if self._loaded_version != self.version or time.monotonic() >= self._expires_at:
+                    version = self.version
+                    self._categories = [tuple(row) for row in db.session.query(
+                        Category.name, Category.restaurant_count).order_by(Category.name)]
+                    self._loaded_version = version
+                    self._expires_at = time.monotonic() + self.ttl
+        return self._categories
+
+    def invalidate(self):
+        self.version += 1
+
+
+category_cache = CategoryCache()
+
+
+def category_names():
+    """Every category in the taxonomy, sorted by name."""
+    return [name for name, _ in category_cache.get()]
+
+
+def active_category_names():
+    """Categories that at least one restaurant belongs to."""
+    return [name for name, count in category_cache.get() if count > 0]
+
+
+def is_valid_category(name):
+    return name in category_names()
+
+
+def record_category_change(old_category, new_category):
+    """Moves one restaurant between categories' counts, in the caller's transaction.
+
+    Call invalidate_categories() after the transaction commits.
+    """
+    if old_category == new_category:
+        return
+    if old_category:
+        db.session.execute(update(Category).where(Category.name == old_category)
+                           .values(restaurant_count=Category.restaurant_count - 1))
+    if new_category:
+        db.session.execute(update(Category).where(Category.name == new_category)
+                           .values(restaurant_count=Category.restaurant_count + 1))
+
+
+def invalidate_categories():
+    category_cache.invalidate()
+
+
+def ensure_categories():
+    """Seeds the taxonomy on first run from the default list and the categories restaurants already use."""
+    if db.session.query(Category.id).first() is not None:
+        return
+    rebuild_categories()
+
+
+def rebuild_categories():
+    """Adds any missing categories and recounts restaurants per category. Returns the number of categories."""
+    counts = dict(db.session.query(Restaurant.category, func.count(Restaurant.restaurant_id))
+                  .group_by(Restaurant.category).all())
+    existing = {category.name: category for category in Category.query.all()}
+
+    for name in sorted(set(DEFAULT_CATEGORIES) | set(counts) | set(existing)):
+        if not name:
+            continue
+        category = existing.get(name)
+        if category is None:
+            category = Category(name=name)
+            db.session.add(category)
+        category.restaurant_count = counts.get(name, 0)
+
+    db.session.commit()
+    invalidate_categories()
+    return Category.query.count()
+
+
+@categories_cli.command('rebuild')
+def rebuild_command():
+    """Add categories used by restaurants and recount restaurants per category."""
+    count = rebuild_categories()
+    bump_all_content_versions()  # The category filter and counts are on every listing page
+    db.session.commit()
+    click.echo(f'{count} categories.')
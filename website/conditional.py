@@ -0,0 +1,37 @@
+import hashlib
+from datetime import timezone
+
+from flask import request, session, make_response
+
+
+def conditional_response(validator, last_modified, render):
+    """Answers a GET with 304 Not Modified when the client's cached copy is still valid.
+
+    validator is anything with a stable repr that changes whenever the response would (content versions,
+    the viewing user, query args). render() is only called when a full response is needed.
+    """
+    etag = hashlib.sha1(repr(validator).encode()).hexdigest()
+    if last_modified is not None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+
+    # Pending flash messages have to be rendered, so never answer 304 while there are any
+    if '_flashes' not in session:
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains_weak(etag)
+        else:
+            not_modified = last_modified is not None and request.if_modified_since is not None \
+                           and last_modified <= request.if_modified_since
+        if not_modified:
+            response = make_response('', 304)
+            return _add_validators(response, etag, last_modified)
+
+    return _add_validators(make_response(render()), etag, last_modified)
+
+
+def _add_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Pages are per-user, and clients must revalidate before reusing them
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,78 @@
+import csv
+import io
+import json
+from datetime import datetime, time, timedelta
+
+from . import db
+from .models import Order, OrderItem
+
+EXPORT_FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+EXPORT_BATCH_SIZE = 1000  # Rows fetched from the database at a time
+
+CSV_COLUMNS = ['order_id', 'created_at', 'status', 'service_option', 'customer_id', 'order_total',
+               'item_name', 'quantity', 'unit_price', 'line_total']
+
+
+def order_line_rows(restaurant_id, first_day=None, last_day=None, statuses=None):
+    """Yields one row per order line (orders without lines give one row with empty line fields), ordered by order.
+
+    Rows are plain tuples fetched in batches of EXPORT_BATCH_SIZE, so memory use doesn't grow with the number
+    of orders.
+    """
+    query = db.session.query(Order.id, Order.created_at, Order.status, Order.service_option, Order.customer_id,
+                             Order.total_price, OrderItem.item_name, OrderItem.quantity, OrderItem.unit_price) \
+        .outerjoin(OrderItem, OrderItem.order_id == Order.id) \
+        .filter(Order.restaurant_id == restaurant_id)
+    if first_day is not None:
+        query = query.filter(Order.created_at >= datetime.combine(first_day, time.min))
+    if last_day is not None:
+        query = query.filter(Order.created_at < datetime.combine(last_day + timedelta(days=1), time.min))
+    if statuses:
+        query = query.filter(Order.status.in_(statuses))
+    yield from query.order_by(Order.id, OrderItem.id).yield_per(EXPORT_BATCH_SIZE)
+
+
+def csv_chunks(rows):
+    """Encodes rows as CSV text, one chunk per batch of rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for count, row in enumerate(rows, 1):
+        order_id, created_at, status, service_option, customer_id, total, item_name, quantity, unit_price = row
+        line_total = round(quantity * unit_price, 2) if quantity is not None and unit_price is not None else ''
+        writer.writerow([order_id, created_at.isoformat(), status, service_option, customer_id, round(total, 2),
+                         item_name or '', quantity if quantity is not None else '',
+                         unit_price if unit_price is not None else '', line_total])
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def jsonl_chunks(rows):
+    """Encodes rows as one JSON object per order, with its lines nested, one chunk per batch of orders."""
+    lines = []
+    order = None
+    count = 0
+    for row in rows:
+        order_id, created_at, status, service_option, customer_id, total, item_name, quantity, unit_price = row
+        if order is None or order['order_id'] != order_id:
+            if order is not None:
+                lines.append(json.dumps(order) + '\n')
+                count += 1
+                if count % EXPORT_BATCH_SIZE == 0:
+                    yield ''.join(lines)
+                    lines = []
+            order = {'order_id': order_id, 'created_at': created_at.isoformat(), 'status': status,
+                     'service_option': service_option, 'customer_id': customer_id, 'total': round(total, 2),
+                     'items': []}
+        if quantity is not None:
+            order['items'].append({'item_name': item_name, 'quantity': quantity, 'unit_price': unit_price})
+    if order is not None:
+        lines.append(json.dumps(order) + '\n')
+    yield ''.join(lines)
+
+
+def export_chunks(export_format, rows):
+    return csv_chunks(rows) if export_format == 'csv' else jsonl_chunks(rows)
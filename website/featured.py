@@ -0,0 +1,93 @@
+import math
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func
+
+from . import db
+from .models import Restaurant, Order
+
+
+class FeaturedRestaurants:
+    """Weighted sample of restaurants for the landing page, held in memory and refreshed on an interval.
+
+    Each refresh draws pool_size restaurants without replacement, weighted by rating and recent order volume.
+    Requests are then served a window of `count` restaurants from that pool. The window rotates every
+    rotate_seconds, so the home page never has to sort the restaurants table.
+    """
+
+    def __init__(self, count=3, pool_size=12, ttl=300, rotate_seconds=30, recent_days=14):
+        self.count = count
+        self.pool_size = pool_size
+        self.ttl = ttl
+        self.rotate_seconds = rotate_seconds
+        self.recent_days = recent_days
+        self._pool = []
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Returns the current window of featured restaurant cards (plain dicts)."""
+        if time.monotonic() >= self._expires_at:
+            # Only one thread refreshes; the others keep serving the previous pool if there is one
+            if self._lock.acquire(blocking=not self._pool):
+                try:
+                    if time.monotonic() >= self._expires_at:
+                        self.refresh()
+                finally:
+                    self._lock.release()
+
+        pool = self._pool
+        if len(pool) <= self.count:
+            return list(pool)
+        windows = math.ceil(len(pool) / self.count)
+        start = int(time.time() // self.rotate_seconds) % windows * self.count
+        window = pool[start:start + self.count]
+        return window + pool[:self.count - len(window)]  # Wrap the last, partial window
+
+    def invalidate(self):
+        self._expires_at = 0.0
+
+    def refresh(self):
+        since = datetime.utcnow() - timedelta(days=self.recent_days)
+        recent_orders = dict(
+            db.session.query(Order.restaurant_id, func.count(Order.id))
+            .filter(Order.created_at >= since)
+            .group_by(Order.restaurant_id)
+            .all()
+        )
+
+        candidates = db.session.query(Restaurant.restaurant_id, Restaurant.name, Restaurant.category,
+                                      Restaurant.average_rating, Restaurant.cover_image_path,
+                                      Restaurant.content_version) \
+            .filter(Restaurant.cover_image_path.isnot(None)) \
+            .all()
+
+        # Weighted sampling without replacement (Efraimidis-Spirakis): keep the largest u ** (1 / weight)
+        def sample_key(row):
+            weight = 1.0 + (row.average_rating or 0.0) + math.log1p(recent_orders.get(row.restaurant_id, 0))
+            return random.random() ** (1.0 / weight)
+
+        chosen = sorted(candidates, key=sample_key, reverse=True)[:self.pool_size]
+        self._pool = [{
+            'restaurant_id': row.restaurant_id,
+            'name': row.name,
+            'category': row.category,
+            'average_rating': row.average_rating or 0.0,
+            'cover_image_path': row.cover_image_path,
+            'content_version': row.content_version,
+        } for row in chosen]
+        self._expires_at = time.monotonic() + self.ttl
+
+
+def featured_restaurants():
+    """The app's FeaturedRestaurants service, created on first use from the FEATURED_* config values."""
+    service = current_app.extensions.get('featured_restaurants')
+    if service is None:
+        service = FeaturedRestaurants(count=current_app.config.get('FEATURED_COUNT', 3),
+                                      ttl=current_app.config.get('FEATURED_REFRESH_SECONDS', 300))
+        current_app.extensions['featured_restaurants'] = service
+    return service
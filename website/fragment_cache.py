@@ -0,0 +1,49 @@
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from .cache import MemoryCache
+
+
+class FragmentCacheExtension(Extension):
+    """Adds a {% cache %} tag that stores rendered template fragments.
+
+    Usage: {% cache 'restaurant_card', restaurant.restaurant_id, restaurant.content_version %} ... {% endcache %}
+
+    The arguments form the cache key, so include the version of every entity the fragment depends on;
+    a changed version simply misses. Anything user-specific must stay outside the block.
+    """
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)  # Set by init_fragment_cache()
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key_parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key_parts.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render_cached', [nodes.List(key_parts)]), [], [], body) \
+            .set_lineno(lineno)
+
+    def _render_cached(self, key_parts, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        key = 'fragment:' + ':'.join(str(part) for part in key_parts)
+        fragment = cache.get(key)
+        if fragment is None:
+            fragment = Markup(caller())
+            cache.set(key, fragment)
+        return fragment
+
+
+def init_fragment_cache(app):
+    """Registers the {% cache %} tag, sized by FRAGMENT_CACHE_MAX_BYTES and FRAGMENT_CACHE_TTL."""
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache = MemoryCache(max_entries=app.config.get('FRAGMENT_CACHE_MAX_ENTRIES', 10000),
+                                               max_bytes=app.config.get('FRAGMENT_CACHE_MAX_BYTES', 8 * 1024 * 1024),
+                                               default_ttl=app.config.get('FRAGMENT_CACHE_TTL', 3600))
+    app.extensions['fragment_cache'] = app.jinja_env.fragment_cache
@@ -0,0 +1,245 @@
+import hashlib
+import json
+import math
+import re
+import urllib.parse
+import urllib.request
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import and_, or_
+
+from . import db
+from .catalogue import bump_all_content_versions
+from .models import Customer, Restaurant, GeocodeCache
+
+geo_cli = AppGroup('geo', help='Geocode customer and restaurant addresses.')
+
+EARTH_RADIUS_KM = 6371.0088
+GEOHASH_PRECISION = 7  # ~150 m cells, stored on every located account
+MAX_SEARCH_RADIUS_KM = 100.0
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+# --- Geohash ---
+
+def geohash_encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    geohash, bits, bit_count, even = [], 0, 0, True
+    while len(geohash) < precision:
+        value, interval = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(_BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(geohash)
+
+
+def geohash_cell_size(precision):
+    """Returns the (height, width) of a geohash cell in degrees."""
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def geohash_neighbourhood(latitude, longitude, precision):
+    """The cell containing the point plus its eight neighbours."""
+    height, width = geohash_cell_size(precision)
+    cells = set()
+    for d_lat in (-height, 0, height):
+        for d_lon in (-width, 0, width):
+            lat = max(-90.0, min(90.0, latitude + d_lat))
+            lon = (longitude + d_lon + 180.0) % 360.0 - 180.0
+            cells.add(geohash_encode(lat, lon, precision))
+    return cells
+
+
+def _precision_for_radius(radius_km, latitude):
+    """Finest precision whose cells are at least radius_km across, so a 3x3 neighbourhood covers the circle."""
+    km_per_degree = math.pi * EARTH_RADIUS_KM / 180.0
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = geohash_cell_size(precision)
+        if height * km_per_degree >= radius_km and \
+                width * km_per_degree * math.cos(math.radians(latitude)) >= radius_km:
+            return precision
+    return 1
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+# --- Geocoders ---
+
+class OfflineGeocoder:
+    """Deterministic stand-in for development and tests; needs no network access.
+
+    Places an Australian address near its state's capital, offset by a hash of the full address so that
+    different addresses land at different (but stable) points up to ~30 km away.
+    """
+    name = 'offline'
+
+    STATE_CENTRES = {
+        'NSW': (-33.8688, 151.2093),
+        'VIC': (-37.8136, 144.9631),
+        'QLD': (-27.4698, 153.0251),
+        'WA': (-31.9523, 115.8613),
+        'SA': (-34.9285, 138.6007),
+        'TAS': (-42.8821, 147.3272),
+        'ACT': (-35.2809, 149.1300),
+        'NT': (-12.4634, 130.8456),
+    }
+    _STATE_PATTERN = re.compile(r'\b(NSW|VIC|QLD|WA|SA|TAS|ACT|NT)\b', re.IGNORECASE)
+
+    def geocode(self, address):
+        match = self._STATE_PATTERN.search(address or '')
+        if not match:
+            return None
+        latitude, longitude = self.STATE_CENTRES[match.group(1).upper()]
+        digest = hashlib.sha256(normalise_address(address).encode()).digest()
+        d_lat = int.from_bytes(digest[:4], 'big') / 2 ** 32 - 0.5
+        d_lon = int.from_bytes(digest[4:8], 'big') / 2 ** 32 - 0.5
+        return latitude + d_lat * 0.5, longitude + d_lon * 0.5
+
+
+class NominatimGeocoder:
+    """Geocodes against an OpenStreetMap Nominatim server (GEOCODER_URL)."""
+    name = 'nominatim'
+
+    def __init__(self, url, user_agent='dasher', timeout=5):
+        self.url = url
+        self.user_agent = user_agent
+        self.timeout = timeout
+
+    def geocode(self, address):
+        query = urllib.parse.urlencode({'q': address, 'format': 'json', 'limit': 1})
+        request = urllib.request.Request(f'{self.url}?{query}', headers={'User-Agent': self.user_agent})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                results = json.load(response)
+        except (OSError, ValueError):
+            return None
+        if not results:
+            return None
+        return float(results[0]['lat']), float(results[0]['lon'])
+
+
+def get_geocoder():
+    """Returns the geocoder selected by the GEOCODER config value, created once per app."""
+    geocoder = current_app.extensions.get('geocoder')
+    if geocoder is None:
+        name = current_app.config.get('GEOCODER', 'offline')
+        if name == 'nominatim':
+            geocoder = NominatimGeocoder(current_app.config.get('GEOCODER_URL',
+                                                                'https://nominatim.openstreetmap.org/search'))
+        elif name == 'offline':
+            geocoder = OfflineGeocoder()
+        else:
+            raise ValueError(f'Unknown geocoder: {name}')
+        current_app.extensions['geocoder'] = geocoder
+    return geocoder
+
+
+def normalise_address(address):
+    return ' '.join((address or '').lower().replace(',', ' ').split())
+
+
+def geocode_address(address):
+    """Returns (latitude, longitude) for an address, or None, consulting the persistent cache first.
+
+    New lookups (including misses) are added to the cache in the caller's transaction.
+    """
+    normalised = normalise_address(address)
+    if not normalised:
+        return None
+    address_key = hashlib.sha1(normalised.encode()).hexdigest()
+
+    cached = db.session.get(GeocodeCache, address_key)
+    if cached is not None:
+        return None if cached.latitude is None else (cached.latitude, cached.longitude)
+
+    geocoder = get_geocoder()
+    location = geocoder.geocode(address)
+    db.session.add(GeocodeCache(address_key=address_key, address=normalised[:255], provider=geocoder.name,
+                                latitude=location[0] if location else None,
+                                longitude=location[1] if location else None))
+    return location
+
+
+def locate(account):
+    """Geocodes a customer's or restaurant's address onto its latitude/longitude/geohash columns."""
+    location = geocode_address(account.address)
+    if location is None:
+        account.latitude = account.longitude = account.geohash = None
+    else:
+        account.latitude, account.longitude = location
+        account.geohash = geohash_encode(*location)
+    return location
+
+
+# --- Spatial queries ---
+
+def restaurants_within(latitude, longitude, radius_km):
+    """Returns [(restaurant_id, distance_km)] for restaurants within the radius, nearest first.
+
+    Candidates come from an index range scan over the 3x3 geohash cells covering the circle; only those
+    candidates get an exact great-circle distance check.
+    """
+    radius_km = min(radius_km, MAX_SEARCH_RADIUS_KM)
+    precision = _precision_for_radius(radius_km, latitude)
+    cells = geohash_neighbourhood(latitude, longitude, precision)
+
+    # geohash >= prefix AND geohash < prefix + '~' is a prefix match the geohash index can serve
+    prefix_ranges = [and_(Restaurant.geohash >= cell, Restaurant.geohash < cell + '~') for cell in cells]
+    candidates = db.session.query(Restaurant.restaurant_id, Restaurant.latitude, Restaurant.longitude) \
+        .filter(or_(*prefix_ranges)).all()
+
+    results = []
+    for restaurant_id, lat, lon in candidates:
+        distance = haversine_km(latitude, longitude, lat, lon)
+        if distance <= radius_km:
+            results.append((restaurant_id, distance))
+    results.sort(key=lambda result: result[1])
+    return results
+
+
+def nearest_restaurants(latitude, longitude, limit=10, max_radius_km=MAX_SEARCH_RADIUS_KM):
+    """Returns up to limit [(restaurant_id, distance_km)] nearest first, widening the search radius as needed."""
+    radius_km = 2.0
+    while True:
+        results = restaurants_within(latitude, longitude, radius_km)
+        if len(results) >= limit or radius_km >= max_radius_km:
+            return results[:limit]
+        radius_km = min(radius_km * 4, max_radius_km)
+
+
+@geo_cli.command('backfill')
+@click.option('--all', 'regeocode', is_flag=True, help='Geocode every account, not just those without a location.')
+def backfill_command(regeocode):
+    """Geocode customer and restaurant addresses onto their location columns."""
+    located = missing = 0
+    for model in (Customer, Restaurant):
+        query = model.query
+        if not regeocode:
+            query = query.filter(model.latitude.is_(None))
+        for account in query.all():
+            if locate(account):
+                located += 1
+            else:
+                missing += 1
+        db.session.commit()
+    bump_all_content_versions()  # Listings show distances and filter by radius
+    db.session.commit()
+    click.echo(f'Located {located} accounts; {missing} addresses could not be geocoded.')
@@ -0,0 +1,75 @@
+from flask import current_app, session
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from . import db
+from .cache import MemoryCache
+from .models import Customer, Restaurant
+
+# Flask-Login session ids are '<prefix>:<primary key>', so loading a user is one primary-key lookup
+ACCOUNT_TYPES = {'c': Customer, 'r': Restaurant}
+LEGACY_USER_TYPES = {'customer': 'c', 'restaurant': 'r'}
+
+
+def parse_user_id(user_id):
+    """Returns (model, primary key) for a Flask-Login user id, or (None, None) if it isn't one.
+
+    Plain numeric ids from sessions issued before ids were typed are resolved with the session's user_type.
+    Without one (e.g. an old remember-me cookie) the id is rejected, which sends the user back to the login
+    page rather than guessing which table it belongs to.
+    """
+    prefix, _, pk = str(user_id).rpartition(':')
+    if not prefix:
+        prefix = LEGACY_USER_TYPES.get(session.get('user_type'))
+    model = ACCOUNT_TYPES.get(prefix)
+    try:
+        return (model, int(pk)) if model is not None else (None, None)
+    except ValueError:
+        return None, None
+
+
+def identity_cache():
+    """Per-process cache of account rows for load_user(); None when IDENTITY_CACHE_TTL is 0."""
+    if 'identity_cache' not in current_app.extensions:
+        ttl = current_app.config.get('IDENTITY_CACHE_TTL', 0)
+        current_app.extensions['identity_cache'] = MemoryCache(
+            max_entries=current_app.config.get('IDENTITY_CACHE_MAX_ENTRIES', 4096), default_ttl=ttl) if ttl else None
+    return current_app.extensions['identity_cache']
+
+
+def load_identity(user_id):
+    """The Customer or Restaurant for a Flask-Login user id, or None.
+
+    With the identity cache enabled, a hit costs no query and returns a detached copy of the account as it was
+    when cached. It is good for telling who is signed in and for display, but it is kept out of the request's
+    session so that queries for the same account still return the current row. Code that reads state other
+    requests change (event_seq, category) or changes the account must load it with db.session.get().
+    Entries live for IDENTITY_CACHE_TTL seconds and are dropped by invalidate_identity() when this process
+    changes the account; other processes see such changes once their entry expires.
+    """
+    model, pk = parse_user_id(user_id)
+    if model is None:
+        return None
+
+    cache = identity_cache()
+    key = f'{model.__tablename__}:{pk}'
+    columns = cache.get(key) if cache is not None else None
+    if columns is not None:
+        user = model.__mapper__.class_manager.new_instance()
+        for name, value in columns.items():
+            setattr(user, name, value)
+        make_transient_to_detached(user)
+        return user
+
+    user = db.session.get(model, pk)
+    if user is not None and cache is not None:
+        cache.set(key, {attr.key: getattr(user, attr.key) for attr in inspect(model).column_attrs})
+    return user
+
+
+def invalidate_identity(user):
+    """Drops the account from this process's identity cache after a profile, membership or password change."""
+    cache = identity_cache()
+    if cache is not None:
+        model, pk = parse_user_id(user.get_id())
+        cache.delete(f'{model.__tablename__}:{pk}')
@@ -1,6 +1,6 @@
 from flask_login import UserMixin
 from datetime import datetime
-from sqlalchemy import Integer, Column, String, DateTime, Float, ForeignKey, Boolean
+from sqlalchemy import Integer, Column, String, DateTime, Float, ForeignKey, Boolean, Index, func
 from sqlalchemy.orm import relationship
 
 from . import db
@@ -8,12 +8,12 @@ from . import db
 
 class CustomerMixin(UserMixin):
     def get_id(self):
-        return self.customer_id  # Assuming your customer model has a 'customer_id' field
+        return f'c:{self.customer_id}'  # Typed, because customer and restaurant ids overlap (see identity.py)
 
 
 class RestaurantMixin(UserMixin):
     def get_id(self):
-        return self.restaurant_id
+        return f'r:{self.restaurant_id}'
 
 
 class BaseUser(db.Model):
@@ -24,6 +24,11 @@ class BaseUser(db.Model):
     address = Column(String(128), nullable=False)
     type = Column(String(50))  # Column to store 'customer' or 'restaurant'
 
+    # Geocoded address, filled in by geo.locate()
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    geohash = Column(String(12), nullable=True)
+
     __mapper_args__ = {
         'polymorphic_identity': 'type',
         'polymorphic_on': type
@@ -56,11 +61,40 @@ def generate_restaurant_id():
 class Restaurant(BaseUser, RestaurantMixin):
     __tablename__ = 'restaurants'
     __mapper_args__ = {'polymorphic_identity': 'restaurant'}
+    __table_args__ = (
+        # Keyset pagination indexes for the restaurant listings
+        Index('ix_restaurants_rating_id', 'average_rating', 'restaurant_id'),
+        Index('ix_restaurants_price_id', 'min_item_price', 'restaurant_id'),
+        Index('ix_restaurants_geohash', 'geohash'),  # Spatial lookups in geo.restaurants_within()
+        Index('ix_restaurants_content_updated_at', 'content_updated_at'),  # Listing Last-Modified
+    )
 
     restaurant_id = db.Column(Integer, primary_key=True)
     category = Column(String(64), nullable=False)
     average_rating = Column(Float, default=0.0)
 
+    # Stored review aggregates, kept up to date by ratings.record_review()
+    review_count = Column(Integer, default=0, nullable=False)
+    rating_sum = Column(Integer, default=0, nullable=False)
+    rating_1_count = Column(Integer, default=0, nullable=False)
+    rating_2_count = Column(Integer, default=0, nullable=False)
+    rating_3_count = Column(Integer, default=0, nullable=False)
+    rating_4_count = Column(Integer, default=0, nullable=False)
+    rating_5_count = Column(Integer, default=0, nullable=False)
+
+    # Listing card fields derived from the menu, kept up to date by cards.refresh_card_fields()
+    cover_image_path = Column(String(255), nullable=True)
+    menu_item_count = Column(Integer, default=0, nullable=False)
+    min_item_price = Column(Float, nullable=True)
+    avg_item_price = Column(Float, nullable=True)
+
+    # Bumped whenever anything shown on the restaurant's customer-facing pages changes (see catalogue.py)
+    content_version = Column(Integer, default=1, nullable=False)
+    content_updated_at = Column(DateTime, default=datetime.utcnow, nullable=True)
+
+    # Sequence number of the restaurant's latest order event (see outbox.record_order_event())
+    event_seq = Column(Integer, default=0, nullable=False)
+
     menu_items = relationship('MenuItem', backref='restaurant')  # One-to-many relationship with MenuItem
     orders = relationship('Order', backref='restaurant', lazy='dynamic')  # One-to-many relationship with Order
 
@@ -70,6 +104,15 @@ class Restaurant(BaseUser, RestaurantMixin):
         self.address = address
         self.user_type = "restaurant"
 
+    @property
+    def rating_histogram(self):
+        """Number of reviews for each star rating, keyed 1 to 5."""
+        return {stars: getattr(self, f'rating_{stars}_count') or 0 for stars in range(1, 6)}
+
+
+# The name listing sorts on coalesce(name, '') because name is nullable (see views._restaurant_listing())
+Index('ix_restaurants_sort_name_id', func.coalesce(Restaurant.name, ''), Restaurant.restaurant_id)
+
 
 class MenuItem(db.Model):
     __tablename__ = 'menu_items'
@@ -78,7 +121,7 @@ class MenuItem(db.Model):
     name = Column(String(128), nullable=False)
     description = Column(String(128), nullable=False)
     price = Column(Float, nullable=False)
-    restaurant_id = Column(Integer, ForeignKey('restaurants.restaurant_id'))
+    restaurant_id = Column(Integer, ForeignKey('restaurants.restaurant_id'), index=True)
     image_path = db.Column(db.String(255))
 
     def __init__(self, name, description, price, restaurant_id, image_path):
@@ -94,17 +137,30 @@ class OrderItem(db.Model):
     order_id = Column(Integer, ForeignKey('orders.id'))
     menu_item_id = Column(Integer, ForeignKey('menu_items.id'))
     quantity = Column(Integer, nullable=False)
+    # The menu item's price and name when the order was placed; later menu edits don't change past orders
+    unit_price = Column(Float, nullable=True)
+    item_name = Column(String(128), nullable=True)
 
     menu_item = db.relationship('MenuItem', backref='order_items')
 
-    def __init__(self, order_id, menu_item_id, quantity):
+    def __init__(self, order_id, menu_item_id, quantity, unit_price=None, item_name=None):
         self.order_id = order_id
         self.menu_item_id = menu_item_id
         self.quantity = quantity
+        self.unit_price = unit_price
+        self.item_name = item_name
 
 
 class Order(db.Model):
     __tablename__ = 'orders'
+    __table_args__ = (
+        # One order per checkout form, however often it is submitted (see orders.place_order())
+        Index('ux_orders_customer_idempotency_key', 'customer_id', 'idempotency_key', unique=True),
+        Index('ix_orders_customer_created_id', 'customer_id', 'created_at', 'id'),  # Customer order history pages
+        # Restaurant order queue: the pending list and status-filtered pages, and unfiltered pages
+        Index('ix_orders_restaurant_status_created', 'restaurant_id', 'status', 'created_at'),
+        Index('ix_orders_restaurant_created_id', 'restaurant_id', 'created_at', 'id'),
+    )
 
     id = Column(Integer, primary_key=True)
     customer_id = Column(Integer, ForeignKey('customers.customer_id'), nullable=False)
@@ -115,6 +171,7 @@ class Order(db.Model):
     status = Column(String(64), nullable=False)  # e.g., "Pending", "Accepted", "Rejected", "Completed"
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)  # Timestamp for order creation
     reviews = db.relationship('Review', backref='order', lazy=True)
+    idempotency_key = Column(String(64), nullable=True)  # From the checkout form; null for older orders
 
     def __init__(self, customer_id, restaurant_id, items, total_price, service_option, status):
         self.customer_id = customer_id
@@ -129,4 +186,79 @@ class Review(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)  # Associate with the order
     rating = db.Column(db.Integer, nullable=False)
-    comment = db.Column(db.Text)  # Optional comment field
\ No newline at end of file
+    comment = db.Column(db.Text)  # Optional comment field
+
+
+class Category(db.Model):
+    __tablename__ = 'categories'
+    id = Column(Integer, primary_key=True)
+    name = Column(String(64), unique=True, nullable=False)
+    restaurant_count = Column(Integer, default=0, nullable=False)  # Maintained by categories.record_category_change()
+
+
+class GeocodeCache(db.Model):
+    __tablename__ = 'geocode_cache'
+    address_key = Column(String(40), primary_key=True)  # sha1 of the normalised address
+    address = Column(String(255), nullable=False)
+    latitude = Column(Float, nullable=True)  # Null when the address couldn't be geocoded
+    longitude = Column(Float, nullable=True)
+    provider = Column(String(32), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class ServerSession(db.Model):
+    __tablename__ = 'server_sessions'
+    id = Column(String(64), primary_key=True)  # sha256 of the opaque session cookie
+    data = Column(db.Text, nullable=False)  # Serialised session dict (see sessions.py)
+    customer_id = Column(Integer, nullable=True, index=True)  # Set while a customer is logged in
+    cart_items = Column(Integer, default=0, nullable=False)  # Total quantity in session['cart']
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class OrderEvent(db.Model):
+    __tablename__ = 'order_events'
+    __table_args__ = (
+        Index('ix_order_events_pending', 'dispatched_at', 'id'),  # The dispatcher's "oldest undelivered" scan
+        Index('ux_order_events_restaurant_seq', 'restaurant_id', 'restaurant_seq', unique=True),  # Replay
+    )
+    id = Column(Integer, primary_key=True)
+    order_id = Column(Integer, ForeignKey('orders.id'), nullable=False)
+    restaurant_id = Column(Integer, nullable=False)
+    restaurant_seq = Column(Integer, nullable=True)  # Gapless per restaurant; null for events from before replay
+    customer_id = Column(Integer, nullable=False)
+    event_type = Column(String(32), nullable=False)  # 'new_order' or 'order_status'
+    payload = Column(db.Text, nullable=False)  # JSON
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    dispatched_at = Column(DateTime, nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+
+
+class Account(db.Model):
+    __tablename__ = 'accounts'
+    __table_args__ = (
+        Index('ux_accounts_type_id', 'account_type', 'account_id', unique=True),
+    )
+    email = Column(String(120), primary_key=True)  # Lower-cased and stripped (see accounts.normalise_email())
+    account_type = Column(String(16), nullable=False)  # 'customer' or 'restaurant'
+    account_id = Column(Integer, nullable=False)  # customer_id or restaurant_id
+
+
+class RestaurantDailyStats(db.Model):
+    __tablename__ = 'restaurant_daily_stats'
+    # Maintained by reports.record_order_placed() / record_status_change(); rebuilt by 'flask reports rebuild'
+    restaurant_id = Column(Integer, primary_key=True)
+    day = Column(db.Date, primary_key=True)  # UTC day the orders were placed
+    order_count = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0.0, nullable=False)  # Sum of order totals, after membership discounts
+    items_sold = Column(Integer, default=0, nullable=False)
+
+
+class RestaurantDailyItemStats(db.Model):
+    __tablename__ = 'restaurant_daily_item_stats'
+    restaurant_id = Column(Integer, primary_key=True)
+    day = Column(db.Date, primary_key=True)
+    # The order lines' item_name snapshot ('' for lines without one); unlike menu_item_id it survives item deletion
+    item_name = Column(String(128), primary_key=True)
+    quantity = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0.0, nullable=False)  # Quantity times unit price, before discounts
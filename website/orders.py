@@ -0,0 +1,190 @@
+import secrets
+import threading
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .cart import CartService
+from .models import (Customer, MenuItem, Order, OrderItem, OrderEvent, Restaurant, RestaurantDailyStats,
+                     RestaurantDailyItemStats)
+from .outbox import record_order_event, wake_dispatcher
+from .reports import record_order_placed, record_status_change
+from .exports import EXPORT_FORMATS, order_line_rows, export_chunks
+
+orders_cli = AppGroup('orders', help='Order placement tools.')
+
+ORDER_STATUSES = ['Pending', 'Accepted', 'Rejected', 'In Preparation', 'Out for Delivery', 'Delivered', 'Cancelled',
+                  'Complete']
+
+
+def new_idempotency_key():
+    """Key for a checkout form; resubmitting the form with the same key returns the order it already placed."""
+    return secrets.token_urlsafe(24)
+
+
+def place_order(customer_id, cart, idempotency_key=None):
+    """Places an order for a priced, non-empty cart. Returns (order, created).
+
+    The order row and all of its lines are written in one transaction, the lines with a single bulk INSERT.
+    If the customer already placed an order with this idempotency key (a double-submit or a retry), that order
+    is returned instead and nothing is written.
+    """
+    if idempotency_key:
+        existing = order_for_key(customer_id, idempotency_key)
+        if existing is not None:
+            return existing, False
+
+    order = Order(customer_id=customer_id, restaurant_id=cart.restaurant_id, items=[], total_price=cart.total,
+                  service_option=cart.service_option, status='Pending')
+    order.idempotency_key = idempotency_key
+    try:
+        db.session.add(order)
+        db.session.flush()  # Assigns order.id
+        db.session.execute(insert(OrderItem), [
+            {'order_id': order.id, 'menu_item_id': line.menu_item.id, 'quantity': line.quantity,
+             'unit_price': line.menu_item.price, 'item_name': line.menu_item.name}
+            for line in cart.lines
+        ])
+        record_order_event(order, 'new_order', total_price=order.total_price)
+        record_order_placed(order, [(line.menu_item.name, line.quantity, line.line_total) for line in cart.lines])
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        # A concurrent submit with the same key committed first
+        existing = order_for_key(customer_id, idempotency_key) if idempotency_key else None
+        if existing is None:
+            raise
+        return existing, False
+    wake_dispatcher()
+    return order, True
+
+
+def change_order_status(order, status):
+    """Sets the order's status, queues an order_status event and updates the revenue rollups, in the caller's
+    transaction."""
+    old_status, order.status = order.status, status
+    record_order_event(order, 'order_status')
+    record_status_change(order, old_status)
+
+
+def order_for_key(customer_id, idempotency_key):
+    """The order the customer already placed with this idempotency key, if any."""
+    return Order.query.filter_by(customer_id=customer_id, idempotency_key=idempotency_key).first()
+
+
+def backfill_line_snapshots():
+    """Copies the current menu price and name onto order lines placed before they were snapshotted.
+
+    Returns the number of lines updated. Lines whose menu item no longer exists are left empty.
+    """
+    menu_item = MenuItem.__table__
+    result = db.session.execute(
+        update(OrderItem)
+        .where(OrderItem.unit_price.is_(None))
+        .values(unit_price=select(menu_item.c.price).where(menu_item.c.id == OrderItem.menu_item_id)
+                .scalar_subquery(),
+                item_name=select(menu_item.c.name).where(menu_item.c.id == OrderItem.menu_item_id)
+                .scalar_subquery())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+@orders_cli.command('backfill-prices')
+def backfill_prices_command():
+    """Snapshot unit prices and item names onto order lines that don't have them yet."""
+    count = backfill_line_snapshots()
+    click.echo(f'Snapshotted {count} order lines.')
+
+
+@orders_cli.command('export')
+@click.argument('restaurant_id', type=int)
+@click.option('--format', 'export_format', type=click.Choice(list(EXPORT_FORMATS)), default='csv', show_default=True)
+@click.option('--start-date', type=click.DateTime(['%Y-%m-%d']), help='First day to include.')
+@click.option('--end-date', type=click.DateTime(['%Y-%m-%d']), help='Last day to include.')
+@click.option('--status', 'statuses', type=click.Choice(ORDER_STATUSES), multiple=True,
+              help='Only orders with this status (repeatable).')
+@click.option('--output', type=click.File('w'), default='-', help='File to write to (default: stdout).')
+def export_command(restaurant_id, export_format, start_date, end_date, statuses, output):
+    """Stream a restaurant's orders and their lines as CSV or JSONL."""
+    rows = order_line_rows(restaurant_id, start_date and start_date.date(), end_date and end_date.date(), statuses)
+    for chunk in export_chunks(export_format, rows):
+        output.write(chunk)
+
+
+@orders_cli.command('bench')
+@click.option('--orders', 'order_count', default=200, show_default=True, help='Distinct orders to place.')
+@click.option('--workers', default=8, show_default=True, help='Concurrent submitting threads.')
+@click.option('--lines', default=5, show_default=True, help='Lines per order.')
+@click.option('--duplicates', default=1, show_default=True, help='Extra submits of every order with the same key.')
+def bench_command(order_count, workers, lines, duplicates):
+    """Measure orders/second for concurrent (and duplicated) checkouts against the configured database.
+
+    The run uses its own throwaway restaurant, menu and customers, so no restaurant tablet sees the orders; all of
+    them are deleted again afterwards.
+    """
+    app = current_app._get_current_object()
+    run_id = secrets.token_hex(4)
+    # Unusable password hashes and no accounts entries: nobody can log in as these
+    restaurant = Restaurant(f'bench-{run_id}@bench.invalid', '!', f'Benchmark {run_id}', 'Benchmark', 'Nowhere')
+    customers = [Customer(f'bench-{run_id}-{n}@bench.invalid', '!', None, 'Nowhere') for n in range(workers)]
+    db.session.add(restaurant)
+    db.session.add_all(customers)
+    db.session.flush()
+    restaurant_id = restaurant.restaurant_id
+    customer_ids = [customer.customer_id for customer in customers]
+    menu_items = [MenuItem(f'Benchmark item {n}', 'Benchmark', 1.0 + n, restaurant_id, None)
+                  for n in range(max(lines, 1))]
+    db.session.add_all(menu_items)
+    db.session.commit()
+    menu_item_ids = [item.id for item in menu_items]
+
+    submits = [(n % workers, f'bench-{run_id}-{n}') for n in range(order_count) for _ in range(1 + duplicates)]
+    created = []
+    lock = threading.Lock()
+
+    def worker(offset):
+        with app.app_context():
+            for customer_index, key in submits[offset::workers]:
+                cart = CartService({item_id: 1 for item_id in menu_item_ids}).price()
+                _, was_created = place_order(customer_ids[customer_index], cart, key)
+                with lock:
+                    created.append(was_created)
+
+    try:
+        threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(workers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        _delete_bench_data(restaurant_id, customer_ids)
+
+    placed = sum(created)
+    click.echo(f'{len(created)} submits in {elapsed:.2f}s from {workers} workers: {placed} orders created '
+               f'({placed / elapsed:.1f} orders/s, {len(created) / elapsed:.1f} submits/s).')
+    if placed != order_count:
+        click.echo(f'Expected {order_count} orders; idempotency keys did not hold.', err=True)
+
+
+def _delete_bench_data(restaurant_id, customer_ids):
+    """Deletes a benchmark run's restaurant, customers and everything placed with them, rollups included."""
+    db.session.rollback()
+    bench_orders = select(Order.id).where(Order.restaurant_id == restaurant_id)
+    OrderItem.query.filter(OrderItem.order_id.in_(bench_orders)).delete(synchronize_session=False)
+    OrderEvent.query.filter_by(restaurant_id=restaurant_id).delete(synchronize_session=False)
+    Order.query.filter_by(restaurant_id=restaurant_id).delete(synchronize_session=False)
+    RestaurantDailyStats.query.filter_by(restaurant_id=restaurant_id).delete(synchronize_session=False)
+    RestaurantDailyItemStats.query.filter_by(restaurant_id=restaurant_id).delete(synchronize_session=False)
+    MenuItem.query.filter_by(restaurant_id=restaurant_id).delete(synchronize_session=False)
+    Restaurant.query.filter_by(restaurant_id=restaurant_id).delete(synchronize_session=False)
+    Customer.query.filter(Customer.customer_id.in_(customer_ids)).delete(synchronize_session=False)
+    db.session.commit()
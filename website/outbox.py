@@ -0,0 +1,201 @@
+import json
+import threading
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import update
+
+from . import db, socketio
+from .models import OrderEvent, Restaurant
+
+events_cli = AppGroup('events', help='Inspect and drain the order event outbox.')
+
+MAX_ATTEMPTS = 5  # Events whose subscribers keep failing are left in the table for inspection
+TRIM_EVERY = 50  # Trim a restaurant's event log every this many events
+
+
+def record_order_event(order, event_type, **payload):
+    """Adds an event for the order to the outbox in the caller's transaction.
+
+    The event is only delivered if that transaction commits, and is still delivered if the process dies right
+    after the commit. Call wake_dispatcher() once the commit has gone through.
+
+    Each event gets the restaurant's next sequence number ('seq' in the payload). Clients use it to ask for
+    exactly the events they missed while disconnected (see events_since()).
+    """
+    seq = _next_restaurant_seq(order.restaurant_id)
+    payload = dict(payload, order_id=order.id, restaurant_id=order.restaurant_id, customer_id=order.customer_id,
+                   status=order.status, seq=seq)
+    db.session.add(OrderEvent(order_id=order.id, restaurant_id=order.restaurant_id, restaurant_seq=seq,
+                              customer_id=order.customer_id, event_type=event_type, payload=json.dumps(payload)))
+    if seq % TRIM_EVERY == 0:
+        _trim_event_log(order.restaurant_id, seq)
+
+
+def _next_restaurant_seq(restaurant_id):
+    # The UPDATE locks the restaurant's row until the caller commits, so concurrent orders get distinct numbers
+    db.session.execute(update(Restaurant).where(Restaurant.restaurant_id == restaurant_id)
+                       .values(event_seq=Restaurant.event_seq + 1)
+                       .execution_options(synchronize_session=False))
+    return db.session.query(Restaurant.event_seq).filter(Restaurant.restaurant_id == restaurant_id).scalar()
+
+
+def _trim_event_log(restaurant_id, seq):
+    """Keeps the restaurant's event log bounded to the newest EVENT_LOG_SIZE events (delivered ones only)."""
+    log_size = current_app.config.get('EVENT_LOG_SIZE', 500)
+    OrderEvent.query.filter(OrderEvent.restaurant_id == restaurant_id,
+                            OrderEvent.restaurant_seq <= seq - log_size,
+                            OrderEvent.dispatched_at.isnot(None)) \
+        .delete(synchronize_session=False)
+
+
+def current_seq(restaurant_id):
+    return db.session.query(Restaurant.event_seq).filter(Restaurant.restaurant_id == restaurant_id).scalar() or 0
+
+
+def events_since(restaurant_id, last_seq, limit):
+    """Payloads of the restaurant's events after last_seq, in order.
+
+    Returns None when the log can't fill the gap: events were trimmed, there are more than limit of them, or
+    last_seq is from the future (e.g. a restored database). The client then needs a fresh snapshot instead.
+    """
+    seq = current_seq(restaurant_id)
+    if last_seq > seq:
+        return None
+    if last_seq == seq:
+        return []
+    if seq - last_seq > limit:
+        return None
+    events = OrderEvent.query \
+        .filter(OrderEvent.restaurant_id == restaurant_id, OrderEvent.restaurant_seq > last_seq) \
+        .order_by(OrderEvent.restaurant_seq) \
+        .all()
+    if [event.restaurant_seq for event in events] != list(range(last_seq + 1, seq + 1)):
+        return None
+    return [(event.event_type, json.loads(event.payload)) for event in events]
+
+
+class OutboxDispatcher:
+    """Background thread that drains the order_events outbox in id order and hands each event to subscribers.
+
+    Subscribers are called as subscriber(event_type, payload). Delivery is at-least-once: an event is marked
+    dispatched only after every subscriber has accepted it, so a crash mid-batch re-delivers that batch.
+    """
+
+    def __init__(self, app, batch_size=100, poll_interval=2.0):
+        self.app = app
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.subscribers = []
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def subscribe(self, subscriber):
+        self.subscribers.append(subscriber)
+        return subscriber
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='order-events-dispatcher', daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)  # Polling picks up events committed by other processes
+            self._wakeup.clear()
+            with self.app.app_context():
+                try:
+                    while self.drain_once() == self.batch_size:
+                        pass
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception('Order event dispatch failed')
+                finally:
+                    db.session.remove()
+
+    def drain_once(self):
+        """Delivers one batch of pending events. Returns the number of events in the batch."""
+        events = OrderEvent.query \
+            .filter(OrderEvent.dispatched_at.is_(None), OrderEvent.attempts < MAX_ATTEMPTS) \
+            .order_by(OrderEvent.id) \
+            .limit(self.batch_size) \
+            .all()
+        delivered, failed = [], []
+        for event in events:
+            try:
+                payload = json.loads(event.payload)
+                for subscriber in self.subscribers:
+                    subscriber(event.event_type, payload)
+                delivered.append(event.id)
+            except Exception:
+                self.app.logger.exception('Order event %s could not be delivered', event.id)
+                failed.append(event.id)
+
+        if delivered:
+            db.session.execute(update(OrderEvent).where(OrderEvent.id.in_(delivered))
+                               .values(dispatched_at=datetime.utcnow(), attempts=OrderEvent.attempts + 1)
+                               .execution_options(synchronize_session=False))
+        if failed:
+            db.session.execute(update(OrderEvent).where(OrderEvent.id.in_(failed))
+                               .values(attempts=OrderEvent.attempts + 1)
+                               .execution_options(synchronize_session=False))
+        db.session.commit()
+        return len(events)
+
+
+def socketio_subscriber(event_type, payload):
+    """Pushes order events to the restaurant's and the customer's Socket.IO rooms (see realtime.py)."""
+    socketio.emit(event_type, payload, room=f"restaurant_{payload['restaurant_id']}", namespace='/')
+    socketio.emit(event_type, payload, room=f"customer_{payload['customer_id']}", namespace='/')
+
+
+def get_dispatcher():
+    return current_app.extensions['order_events']
+
+
+def wake_dispatcher():
+    """Delivers newly committed events now rather than at the next poll, if this process runs the dispatcher."""
+    get_dispatcher().wake()
+
+
+def init_outbox(app):
+    dispatcher = OutboxDispatcher(app, batch_size=app.config.get('ORDER_EVENTS_BATCH_SIZE', 100),
+                                  poll_interval=app.config.get('ORDER_EVENTS_POLL_SECONDS', 2.0))
+    dispatcher.subscribe(socketio_subscriber)
+    app.extensions['order_events'] = dispatcher
+
+    if app.config.get('ORDER_EVENTS_DISPATCHER', True):
+        # Start with the first request so that CLI commands don't spawn a dispatcher of their own
+        @app.before_request
+        def start_order_events_dispatcher():
+            dispatcher.start()
+
+
+@events_cli.command('dispatch')
+def dispatch_command():
+    """Deliver all pending events now, in this process."""
+    dispatcher = get_dispatcher()
+    total = 0
+    while True:
+        count = dispatcher.drain_once()
+        total += count
+        if count < dispatcher.batch_size:
+            break
+    click.echo(f'Processed {total} events.')
+
+
+@events_cli.command('prune')
+@click.option('--days', default=7, show_default=True, help='Keep delivered events for this many days.')
+def prune_command(days):
+    """Delete delivered events older than --days."""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    removed = OrderEvent.query.filter(OrderEvent.dispatched_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    click.echo(f'Removed {removed} delivered events.')
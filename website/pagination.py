@@ -0,0 +1,76 @@
+import base64
+import json
+from collections import namedtuple
+
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+Page = namedtuple('Page', ['items', 'next_cursor'])
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    """Packs the sort key of the last row on a page into an opaque, URL-safe token."""
+    raw = json.dumps(list(values), separators=(',', ':'), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(str(e))
+    if not isinstance(values, list):
+        raise InvalidCursor('cursor must encode a list')
+    return values
+
+
+def page_size_arg(args, default=DEFAULT_PAGE_SIZE):
+    """Reads ?limit= from the request args, clamped to 1..MAX_PAGE_SIZE."""
+    try:
+        limit = int(args.get('limit', default))
+    except (TypeError, ValueError):
+        limit = default
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def keyset_paginate(query, order, key, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """Returns one page of a query using keyset (seek) pagination.
+
+    order is a list of (expression, descending) pairs whose values together are unique per row, e.g. a sort
+    column followed by the primary key. key(row) must return the values of those expressions for a row.
+    The page costs one indexed range scan of page_size + 1 rows no matter how deep into the listing it is.
+    """
+    last_values = decode_cursor(cursor) if isinstance(cursor, str) else cursor
+    if last_values is not None:
+        if len(last_values) != len(order):
+            raise InvalidCursor('cursor does not match the sort order')
+        query = query.filter(_after(order, last_values))
+
+    query = query.order_by(*[expression.desc() if descending else expression.asc()
+                             for expression, descending in order])
+    rows = query.limit(page_size + 1).all()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(key(rows[-1]))
+    return Page(rows, next_cursor)
+
+
+def _after(order, values):
+    """Builds (a > x) OR (a = x AND b > y) ... for the given sort order, honouring each column's direction."""
+    clauses = []
+    for position, (expression, descending) in enumerate(order):
+        equal_prefix = [order[i][0] == values[i] for i in range(position)]
+        beyond = expression < values[position] if descending else expression > values[position]
+        clauses.append(and_(*equal_prefix, beyond))
+    return or_(*clauses)
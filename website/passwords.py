@@ -0,0 +1,160 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+passwords_cli = AppGroup('passwords', help='Password hashing tools.')
+
+
+class HasherBusy(Exception):
+    """Raised when too many hashes are already waiting, or one waited too long; the caller should ask the user to
+    retry."""
+
+
+def method_parameters(method):
+    """Splits a werkzeug method string into (algorithm, parameters), filling in werkzeug's defaults.
+
+    'pbkdf2:sha256' and the 'pbkdf2:sha256:260000' werkzeug stores in the hash then compare equal.
+    """
+    algorithm, *args = method.split(':')
+    if algorithm == 'pbkdf2':
+        return algorithm, (args[0] if args else 'sha256',
+                           int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS)
+    if algorithm == 'scrypt':
+        n, r, p = [int(arg) for arg in args] + [2 ** 15, 8, 1][len(args):]
+        return algorithm, (n, r, p)
+    return algorithm, tuple(args)
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords on a bounded pool of worker threads.
+
+    hashlib's PBKDF2 releases the GIL, so the pool's workers hash in parallel while request threads wait without
+    using CPU. At most max_queue hashes wait for a worker; beyond that, calls fail fast with HasherBusy instead
+    of piling up behind a login burst. A hash still waiting after timeout seconds also gives HasherBusy; its slot
+    is only freed once its worker is done with it, so abandoned hashes still count against the limit.
+    """
+
+    def __init__(self, method='pbkdf2:sha256', workers=4, max_queue=64, timeout=10.0):
+        self.method = method
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hasher')
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._lock = threading.Lock()
+        self.pending = 0  # Queued plus running
+        self.max_pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, method=self.method)
+
+    def verify(self, stored_hash, password):
+        return self._run(check_password_hash, stored_hash, password)
+
+    def needs_rehash(self, stored_hash):
+        """True if the stored hash was made with a different method or work factor than the configured one."""
+        try:
+            return method_parameters(stored_hash.split('$', 1)[0]) != method_parameters(self.method)
+        except ValueError:
+            return True  # Not a hash werkzeug would write with these parameters
+
+    def stats(self):
+        with self._lock:
+            return {'workers': self.workers, 'pending': self.pending,
+                    'queue_depth': max(0, self.pending - self.workers), 'max_pending': self.max_pending,
+                    'completed': self.completed, 'rejected': self.rejected, 'timed_out': self.timed_out}
+
+    def _run(self, function, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusy()
+        with self._lock:
+            self.pending += 1
+            self.max_pending = max(self.max_pending, self.pending)
+        try:
+            future = self._executor.submit(function, *args, **kwargs)
+        except Exception:
+            self._finished(None)
+            raise
+        future.add_done_callback(self._finished)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()  # Drops it if no worker has picked it up yet
+            with self._lock:
+                self.timed_out += 1
+            raise HasherBusy()
+
+    def _finished(self, future):
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+        self._slots.release()
+
+
+def get_password_hasher():
+    """The app's PasswordHasher, created on first use from the PASSWORD_HASH_* config values."""
+    hasher = current_app.extensions.get('password_hasher')
+    if hasher is None:
+        config = current_app.config
+        hasher = PasswordHasher(method=config.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256'),
+                                workers=config.get('PASSWORD_HASH_WORKERS', 4),
+                                max_queue=config.get('PASSWORD_HASH_MAX_QUEUE', 64))
+        current_app.extensions['password_hasher'] = hasher
+    return hasher
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+@passwords_cli.command('bench')
+@click.option('--concurrency', default='1,4,16,64', show_default=True, help='Comma-separated concurrent login counts.')
+@click.option('--logins', default=64, show_default=True, help='Logins per concurrency level.')
+def bench_command(concurrency, logins):
+    """Measure p50/p99 password-check latency of the configured hasher at each concurrency level."""
+    hasher = get_password_hasher()
+    stored_hash = hasher.hash('benchmark password')
+    click.echo(f'{hasher.method}, {hasher.workers} workers, queue limit {hasher.max_queue}')
+
+    for level in [int(value) for value in concurrency.split(',')]:
+        latencies, rejected = [], []
+        lock = threading.Lock()
+
+        def login(count):
+            for _ in range(count):
+                started = time.perf_counter()
+                try:
+                    hasher.verify(stored_hash, 'benchmark password')
+                except HasherBusy:
+                    with lock:
+                        rejected.append(1)
+                    continue
+                with lock:
+                    latencies.append(time.perf_counter() - started)
+
+        threads = [threading.Thread(target=login, args=(logins // level + (n < logins % level),))
+                   for n in range(level)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        if latencies:
+            click.echo(f'concurrency {level:>3}: p50 {_percentile(latencies, 0.50) * 1000:7.1f} ms  '
+                       f'p99 {_percentile(latencies, 0.99) * 1000:7.1f} ms  {len(latencies) / elapsed:6.1f} logins/s  '
+                       f'{len(rejected)} rejected')
+        else:
+            click.echo(f'concurrency {level:>3}: all {len(rejected)} logins rejected')
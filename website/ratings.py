@@ -0,0 +1,62 @@
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func, update
+
+from . import db
+from .catalogue import bump_all_content_versions
+from .models import Restaurant, Order, Review
+
+ratings_cli = AppGroup('ratings', help='Maintain the stored restaurant rating aggregates.')
+
+
+def record_review(restaurant_id, rating):
+    """Adds one rating to the restaurant's stored aggregates.
+
+    Runs as a single UPDATE in the caller's transaction, so it commits (or rolls back) together with the review.
+    """
+    histogram_column = getattr(Restaurant, f'rating_{rating}_count')
+    db.session.execute(
+        update(Restaurant)
+        .where(Restaurant.restaurant_id == restaurant_id)
+        .values({
+            Restaurant.review_count: Restaurant.review_count + 1,
+            Restaurant.rating_sum: Restaurant.rating_sum + rating,
+            Restaurant.average_rating: (Restaurant.rating_sum + rating) * 1.0 / (Restaurant.review_count + 1),
+            histogram_column: histogram_column + 1,
+        })
+        .execution_options(synchronize_session=False)
+    )
+
+
+def rebuild_ratings():
+    """Recomputes every restaurant's aggregates from the reviews table. Returns the number of restaurants updated."""
+    rows = db.session.query(Order.restaurant_id, Review.rating, func.count(Review.id)) \
+        .join(Review, Review.order_id == Order.id) \
+        .group_by(Order.restaurant_id, Review.rating) \
+        .all()
+
+    histograms = {}
+    for restaurant_id, rating, count in rows:
+        if 1 <= rating <= 5:
+            histograms.setdefault(restaurant_id, {})[rating] = count
+
+    restaurants = Restaurant.query.all()
+    for restaurant in restaurants:
+        histogram = histograms.get(restaurant.restaurant_id, {})
+        for stars in range(1, 6):
+            setattr(restaurant, f'rating_{stars}_count', histogram.get(stars, 0))
+        restaurant.review_count = sum(histogram.values())
+        restaurant.rating_sum = sum(stars * count for stars, count in histogram.items())
+        restaurant.average_rating = restaurant.rating_sum / restaurant.review_count if restaurant.review_count else 0.0
+
+    db.session.flush()
+    bump_all_content_versions()
+    db.session.commit()
+    return len(restaurants)
+
+
+@ratings_cli.command('backfill')
+def backfill_command():
+    """Rebuild rating counts, sums and histograms from existing reviews."""
+    count = rebuild_ratings()
+    click.echo(f'Rebuilt ratings for {count} restaurants.')
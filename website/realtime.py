@@ -0,0 +1,68 @@
+from flask import current_app
+from flask_login import current_user
+from flask_socketio import emit, join_room
+
+from . import db, socketio
+from .models import Customer, Order
+from .outbox import current_seq, events_since
+
+
+def user_room(user):
+    """The Socket.IO room that receives a signed-in customer's or restaurant's order events."""
+    if user.type == 'customer':
+        return f'customer_{user.customer_id}'
+    if user.type == 'restaurant':
+        return f'restaurant_{user.restaurant_id}'
+    return None
+
+
+@socketio.on('connect')
+def connect():
+    # Only signed-in users connect, and only to their own room; events are pushed by outbox.socketio_subscriber()
+    if not current_user.is_authenticated:
+        return False
+    room = user_room(current_user)
+    if room is None:
+        return False
+    join_room(room)
+
+
+@socketio.on('resume')
+def resume(data):
+    """A restaurant client (re)connected and reports the last event sequence number it saw.
+
+    Replays just the events it missed, or sends a 'snapshot' of its pending orders when the event log can't
+    cover the gap.
+    """
+    if not current_user.is_authenticated or current_user.type != 'restaurant':
+        return
+    try:
+        last_seq = int((data or {}).get('last_seq'))
+    except (TypeError, ValueError):
+        last_seq = None
+
+    restaurant_id = current_user.restaurant_id
+    missed = None
+    if last_seq is not None:
+        missed = events_since(restaurant_id, last_seq, current_app.config.get('EVENT_REPLAY_LIMIT', 100))
+    if missed is None:
+        emit('snapshot', restaurant_snapshot(restaurant_id))
+        return
+    for event_type, payload in missed:
+        emit(event_type, dict(payload, replayed=True))
+
+
+def restaurant_snapshot(restaurant_id):
+    """The restaurant's pending orders, with the sequence number they are current as of."""
+    seq = current_seq(restaurant_id)  # Read first: events after this are replayed or pushed as usual
+    orders = db.session.query(Order.id, Order.status, Order.total_price, Order.created_at, Customer.name) \
+        .join(Customer, Customer.customer_id == Order.customer_id) \
+        .filter(Order.restaurant_id == restaurant_id, Order.status == 'Pending') \
+        .order_by(Order.id) \
+        .all()
+    return {
+        'seq': seq,
+        'pending_orders': [{'order_id': order_id, 'status': status, 'total_price': total_price,
+                            'created_at': created_at.isoformat(), 'customer_name': customer_name}
+                           for order_id, status, total_price, created_at, customer_name in orders],
+    }
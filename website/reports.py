@@ -0,0 +1,137 @@
+from collections import defaultdict
+from datetime import date
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func, insert, update
+
+from . import db
+from .models import Order, OrderItem, RestaurantDailyStats, RestaurantDailyItemStats
+
+reports_cli = AppGroup('reports', help='Maintain the restaurant revenue rollups.')
+
+UNCOUNTED_STATUSES = ('Rejected', 'Cancelled')  # Orders in these states don't count towards revenue
+
+
+def counts_towards_revenue(status):
+    return status not in UNCOUNTED_STATUSES
+
+
+def record_order_placed(order, lines):
+    """Adds a new order to its restaurant's daily rollups, in the caller's transaction.
+
+    lines are (item_name, quantity, revenue) tuples.
+    """
+    if counts_towards_revenue(order.status):
+        _apply(order, lines, 1)
+
+
+def record_status_change(order, old_status):
+    """Adds or removes the order from the rollups when a status change moves it in or out of revenue."""
+    was_counted, is_counted = counts_towards_revenue(old_status), counts_towards_revenue(order.status)
+    if was_counted != is_counted:
+        _apply(order, _order_lines(order.id), 1 if is_counted else -1)
+
+
+def _order_lines(order_id):
+    rows = db.session.query(OrderItem.item_name, OrderItem.quantity, OrderItem.unit_price) \
+        .filter(OrderItem.order_id == order_id) \
+        .all()
+    return [(name, quantity, quantity * (price or 0.0)) for name, quantity, price in rows]
+
+
+def _apply(order, lines, sign):
+    day = order.created_at.date()
+    _upsert(RestaurantDailyStats, {'restaurant_id': order.restaurant_id, 'day': day}, {
+        'order_count': sign,
+        'revenue': sign * order.total_price,
+        'items_sold': sign * sum(quantity for _, quantity, _ in lines),
+    })
+    for item_name, quantity, revenue in lines:
+        _upsert(RestaurantDailyItemStats,
+                {'restaurant_id': order.restaurant_id, 'day': day, 'item_name': item_name or ''},
+                {'quantity': sign * quantity, 'revenue': sign * revenue})
+
+
+def _upsert(model, key, increments):
+    """Adds increments to the row with this primary key, creating the row if it doesn't exist yet."""
+    table = model.__table__
+    where = [table.c[name] == value for name, value in key.items()]
+    changes = {name: table.c[name] + amount for name, amount in increments.items()}
+    result = db.session.execute(update(table).where(*where).values(changes))
+    if result.rowcount == 0:
+        db.session.execute(insert(table).values(**key, **increments))
+
+
+def revenue_report(restaurant_id, first_day, last_day):
+    """Totals and per-item revenue for the days first_day to last_day inclusive, read from the rollups."""
+    totals = db.session.query(func.coalesce(func.sum(RestaurantDailyStats.order_count), 0),
+                              func.coalesce(func.sum(RestaurantDailyStats.revenue), 0.0),
+                              func.coalesce(func.sum(RestaurantDailyStats.items_sold), 0)) \
+        .filter(RestaurantDailyStats.restaurant_id == restaurant_id,
+                RestaurantDailyStats.day.between(first_day, last_day)) \
+        .one()
+    revenue_by_item = db.session.query(RestaurantDailyItemStats.item_name,
+                                       func.sum(RestaurantDailyItemStats.revenue)) \
+        .filter(RestaurantDailyItemStats.restaurant_id == restaurant_id,
+                RestaurantDailyItemStats.day.between(first_day, last_day)) \
+        .group_by(RestaurantDailyItemStats.item_name) \
+        .having(func.sum(RestaurantDailyItemStats.quantity) > 0) \
+        .order_by(func.sum(RestaurantDailyItemStats.revenue).desc()) \
+        .all()
+    order_count, revenue, items_sold = totals
+    return {'order_count': order_count, 'revenue': revenue, 'items_sold': items_sold}, revenue_by_item
+
+
+def rebuild_daily_stats():
+    """Recomputes both rollup tables from the orders and their line snapshots. Returns the number of restaurant-days.
+
+    Run 'flask orders backfill-prices' first on databases with lines placed before snapshots existed.
+    """
+    counted = Order.status.notin_(UNCOUNTED_STATUSES)
+    day = func.date(Order.created_at)
+
+    item_name = func.coalesce(OrderItem.item_name, '')  # Same key as the incremental path
+    items_sold = defaultdict(int)
+    item_rows = db.session.query(Order.restaurant_id, day, item_name, func.sum(OrderItem.quantity),
+                                 func.coalesce(func.sum(OrderItem.quantity * OrderItem.unit_price), 0.0)) \
+        .join(OrderItem, OrderItem.order_id == Order.id) \
+        .filter(counted) \
+        .group_by(Order.restaurant_id, day, item_name) \
+        .all()
+    for restaurant_id, order_day, _, quantity, _ in item_rows:
+        items_sold[restaurant_id, order_day] += quantity
+
+    order_rows = db.session.query(Order.restaurant_id, day, func.count(Order.id), func.sum(Order.total_price)) \
+        .filter(counted) \
+        .group_by(Order.restaurant_id, day) \
+        .all()
+
+    RestaurantDailyItemStats.query.delete()
+    RestaurantDailyStats.query.delete()
+    if order_rows:
+        db.session.execute(insert(RestaurantDailyStats), [
+            {'restaurant_id': restaurant_id, 'day': _as_date(order_day), 'order_count': count, 'revenue': revenue,
+             'items_sold': items_sold[restaurant_id, order_day]}
+            for restaurant_id, order_day, count, revenue in order_rows
+        ])
+    if item_rows:
+        db.session.execute(insert(RestaurantDailyItemStats), [
+            {'restaurant_id': restaurant_id, 'day': _as_date(order_day), 'item_name': name, 'quantity': quantity,
+             'revenue': revenue}
+            for restaurant_id, order_day, name, quantity, revenue in item_rows
+        ])
+    db.session.commit()
+    return len(order_rows)
+
+
+def _as_date(value):
+    # SQLite's date() returns 'YYYY-MM-DD' strings
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+@reports_cli.command('rebuild')
+def rebuild_command():
+    """Rebuild the daily revenue rollups from all orders."""
+    count = rebuild_daily_stats()
+    click.echo(f'Rebuilt daily stats for {count} restaurant-days.')
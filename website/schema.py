@@ -0,0 +1,55 @@
+import warnings
+
+from sqlalchemy import exc, inspect, text
+from sqlalchemy.schema import CreateIndex
+
+
+def upgrade_schema(db):
+    """Adds columns and indexes declared on the models but missing from existing tables.
+
+    db.create_all() only creates tables that don't exist yet, so columns added to a model later
+    would never reach a database created by an older version of the app.
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                default = _default_sql(column)
+                statement = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                if default is not None:
+                    statement += f' DEFAULT {default}'
+                    if not column.nullable:
+                        statement += ' NOT NULL'
+                connection.execute(text(statement))
+
+            with warnings.catch_warnings():
+                # SQLite doesn't reflect expression indexes; CreateIndex(if_not_exists) skips those that exist
+                warnings.simplefilter('ignore', exc.SAWarning)
+                existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    connection.execute(CreateIndex(index, if_not_exists=True))
+
+
+def _default_sql(column):
+    """Returns a SQL literal for a column's scalar Python default, if it has one."""
+    if column.default is None or not column.default.is_scalar:
+        return None
+    value = column.default.arg
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return None
@@ -0,0 +1,135 @@
+import re
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import case, literal, text, or_
+
+from . import db
+from .catalogue import bump_all_content_versions
+from .models import Restaurant, MenuItem
+
+search_cli = AppGroup('search', help='Maintain the restaurant full-text search index.')
+
+SEARCH_TABLE = 'restaurant_search'
+MAX_RESULTS = 200
+
+# Column weights for bm25(): restaurant_id (unindexed), name, category, menu text
+RANK_WEIGHTS = '0.0, 10.0, 4.0, 1.0'
+
+_TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_enabled():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def ensure_search_index():
+    """Creates the FTS5 table if needed, filling it on first creation."""
+    if not fts_enabled():
+        return
+    exists = db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': SEARCH_TABLE}
+    ).first()
+    if exists:
+        return
+    db.session.execute(text(
+        f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+        "restaurant_id UNINDEXED, name, category, menu_text, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    ))
+    rebuild_search_index()
+
+
+def index_restaurant(restaurant_id):
+    """Refreshes one restaurant's search document. Runs in the caller's transaction."""
+    if not fts_enabled():
+        return
+    db.session.execute(text(f'DELETE FROM {SEARCH_TABLE} WHERE restaurant_id = :id'), {'id': restaurant_id})
+    restaurant = db.session.get(Restaurant, restaurant_id)
+    if restaurant is None:
+        return
+    menu_rows = db.session.query(MenuItem.name, MenuItem.description) \
+        .filter(MenuItem.restaurant_id == restaurant_id).all()
+    db.session.execute(
+        text(f'INSERT INTO {SEARCH_TABLE} (restaurant_id, name, category, menu_text) '
+             'VALUES (:id, :name, :category, :menu_text)'),
+        {'id': restaurant_id, 'name': restaurant.name or '', 'category': restaurant.category or '',
+         'menu_text': _menu_text(menu_rows)}
+    )
+
+
+def rebuild_search_index():
+    """Rebuilds every search document from scratch. Returns the number of restaurants indexed."""
+    if not fts_enabled():
+        return 0
+    menu_text = {}
+    for restaurant_id, name, description in db.session.query(
+            MenuItem.restaurant_id, MenuItem.name, MenuItem.description):
+        menu_text.setdefault(restaurant_id, []).append((name, description))
+
+    rows = [
+        {'id': restaurant_id, 'name': name or '', 'category': category or '',
+         'menu_text': _menu_text(menu_text.get(restaurant_id, []))}
+        for restaurant_id, name, category in db.session.query(
+            Restaurant.restaurant_id, Restaurant.name, Restaurant.category)
+    ]
+    db.session.execute(text(f'DELETE FROM {SEARCH_TABLE}'))
+    if rows:
+        db.session.execute(
+            text(f'INSERT INTO {SEARCH_TABLE} (restaurant_id, name, category, menu_text) '
+                 'VALUES (:id, :name, :category, :menu_text)'),
+            rows
+        )
+    db.session.commit()
+    return len(rows)
+
+
+def search_restaurant_ids(query, limit=MAX_RESULTS):
+    """Returns the ids of restaurants matching the query, best match first."""
+    tokens = _TOKEN_PATTERN.findall(query or '')
+    if not tokens:
+        return []
+
+    if not fts_enabled():
+        return _search_like(tokens, limit)
+
+    # Quote every token so user input can't inject FTS syntax; prefix-match each one
+    match = ' '.join('"{}"*'.format(token.replace('"', '')) for token in tokens)
+    rows = db.session.execute(
+        text(f'SELECT restaurant_id FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :match '
+             f'ORDER BY bm25({SEARCH_TABLE}, {RANK_WEIGHTS}) LIMIT :limit'),
+        {'match': match, 'limit': limit}
+    )
+    return [int(row[0]) for row in rows]
+
+
+def rank_order(restaurant_ids):
+    """ORDER BY expression that keeps restaurants in the given order, e.g. as returned by search_restaurant_ids()."""
+    if not restaurant_ids:
+        return literal(0)  # case() needs at least one WHEN
+    return case({restaurant_id: position for position, restaurant_id in enumerate(restaurant_ids)},
+                value=Restaurant.restaurant_id, else_=len(restaurant_ids))
+
+
+def _search_like(tokens, limit):
+    """Fallback for databases without FTS5: every token must appear in the name, category or menu."""
+    query = db.session.query(Restaurant.restaurant_id).outerjoin(MenuItem)
+    for token in tokens:
+        pattern = f'%{token}%'
+        query = query.filter(or_(Restaurant.name.ilike(pattern), Restaurant.category.ilike(pattern),
+                                 MenuItem.name.ilike(pattern), MenuItem.description.ilike(pattern)))
+    return [row[0] for row in query.distinct().limit(limit)]
+
+
+def _menu_text(menu_rows):
+    return ' '.join(f'{name} {description or ""}' for name, description in menu_rows)
+
+
+@search_cli.command('rebuild')
+def rebuild_command():
+    """Rebuild the search index from the restaurants and menu_items tables."""
+    ensure_search_index()
+    count = rebuild_search_index()
+    bump_all_content_versions()  # Cached search results may list different restaurants now
+    db.session.commit()
+    click.echo(f'Indexed {count} restaurants.')
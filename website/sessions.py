@@ -0,0 +1,264 @@
+import hashlib
+import secrets
+import threading
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from flask.sessions import SecureCookieSession, SessionInterface, session_json_serializer
+from sqlalchemy import delete, func, insert, select, update
+
+from . import db
+from .identity import parse_user_id
+from .models import Customer, ServerSession
+
+sessions_cli = AppGroup('sessions', help='Maintain the server-side session store.')
+
+
+class MemorySessionStore:
+    """Keeps sessions in a dict. For tests and single-process development only."""
+
+    def __init__(self):
+        self._rows = {}  # sid -> (data, customer_id, cart_items, updated_at, expires_at)
+        self._lock = threading.Lock()
+
+    def load(self, sid, now):
+        """Returns (data, expires_at) for a live session, or None."""
+        row = self._rows.get(sid)
+        if row is None or row[4] <= now:
+            return None
+        return row[0], row[4]
+
+    def save(self, sid, data, customer_id, cart_items, now, expires_at):
+        with self._lock:
+            self._rows[sid] = (data, customer_id, cart_items, now, expires_at)
+
+    def touch(self, sid, now, expires_at):
+        with self._lock:
+            row = self._rows.get(sid)
+            if row is not None:
+                self._rows[sid] = row[:3] + (now, expires_at)
+
+    def delete(self, sid):
+        with self._lock:
+            self._rows.pop(sid, None)
+
+    def latest_cart_data(self, customer_id, now):
+        """Serialised data of the customer's most recently updated live session that has a cart."""
+        rows = [row for row in self._rows.values() if row[1] == customer_id and row[2] > 0 and row[4] > now]
+        return max(rows, key=lambda row: row[3])[0] if rows else None
+
+    def compact(self, now):
+        with self._lock:
+            expired = [sid for sid, row in self._rows.items() if row[4] <= now]
+            for sid in expired:
+                del self._rows[sid]
+        return len(expired)
+
+    def stats(self, now, idle_since):
+        live = [row for row in self._rows.values() if row[4] > now]
+        return {'sessions': len(live),
+                'carts': sum(1 for row in live if row[2] > 0),
+                'idle_carts': sum(1 for row in live if row[2] > 0 and row[3] < idle_since)}
+
+
+class SqlSessionStore:
+    """Keeps sessions in the server_sessions table.
+
+    Uses its own short transactions on the engine, so saving a session never commits (or rolls back) whatever
+    the request left in db.session.
+    """
+
+    table = ServerSession.__table__
+
+    def load(self, sid, now):
+        with db.engine.connect() as connection:
+            row = connection.execute(
+                select(self.table.c.data, self.table.c.expires_at)
+                .where(self.table.c.id == sid, self.table.c.expires_at > now)
+            ).first()
+        return None if row is None else (row.data, row.expires_at)
+
+    def save(self, sid, data, customer_id, cart_items, now, expires_at):
+        values = {'data': data, 'customer_id': customer_id, 'cart_items': cart_items,
+                  'updated_at': now, 'expires_at': expires_at}
+        with db.engine.begin() as connection:
+            result = connection.execute(update(self.table).where(self.table.c.id == sid).values(values))
+            if result.rowcount == 0:
+                connection.execute(insert(self.table).values(id=sid, **values))
+
+    def touch(self, sid, now, expires_at):
+        with db.engine.begin() as connection:
+            connection.execute(update(self.table).where(self.table.c.id == sid)
+                               .values(updated_at=now, expires_at=expires_at))
+
+    def delete(self, sid):
+        with db.engine.begin() as connection:
+            connection.execute(delete(self.table).where(self.table.c.id == sid))
+
+    def latest_cart_data(self, customer_id, now):
+        with db.engine.connect() as connection:
+            return connection.execute(
+                select(self.table.c.data)
+                .where(self.table.c.customer_id == customer_id, self.table.c.cart_items > 0,
+                       self.table.c.expires_at > now)
+                .order_by(self.table.c.updated_at.desc())
+                .limit(1)
+            ).scalar()
+
+    def compact(self, now):
+        with db.engine.begin() as connection:
+            return connection.execute(delete(self.table).where(self.table.c.expires_at <= now)).rowcount
+
+    def stats(self, now, idle_since):
+        has_cart = self.table.c.cart_items > 0
+        with db.engine.connect() as connection:
+            row = connection.execute(
+                select(func.count(),
+                       func.count().filter(has_cart),
+                       func.count().filter(has_cart, self.table.c.updated_at < idle_since))
+                .where(self.table.c.expires_at > now)
+            ).first()
+        return {'sessions': row[0], 'carts': row[1], 'idle_carts': row[2]}
+
+
+def create_session_store(config):
+    """Builds the session store selected by SESSION_BACKEND ('sql' or 'memory')."""
+    backend = config.get('SESSION_BACKEND', 'sql')
+    if backend == 'sql':
+        return SqlSessionStore()
+    if backend == 'memory':
+        return MemorySessionStore()
+    raise ValueError(f'Unknown session backend: {backend}')
+
+
+def get_session_store():
+    store = current_app.extensions.get('session_store')
+    if store is None:
+        store = current_app.extensions['session_store'] = create_session_store(current_app.config)
+    return store
+
+
+class ServerSideSession(SecureCookieSession):
+    """Session dict whose cookie holds only an opaque token; the contents live in the session store."""
+
+    def __init__(self, initial=None, token=None, expires_at=None):
+        super().__init__(initial)
+        self.token = token
+        self.expires_at = expires_at
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Stores session contents server-side, keyed by a random token cookie of constant size.
+
+    Sessions expire after SESSION_IDLE_TTL seconds without a write. Unchanged sessions only have their expiry
+    pushed back once half the TTL has passed, so most requests read the store but never write to it.
+    """
+
+    serializer = session_json_serializer
+
+    def open_session(self, app, request):
+        token = request.cookies.get(self.get_cookie_name(app))
+        if token:
+            now = datetime.utcnow()
+            row = get_session_store().load(_session_id(token), now)
+            if row is not None:
+                try:
+                    return ServerSideSession(self.serializer.loads(row[0]), token=token, expires_at=row[1])
+                except ValueError:
+                    pass  # Unreadable data: start over with an empty session
+        return ServerSideSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        store = get_session_store()
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.modified:
+                if session.token:
+                    store.delete(_session_id(session.token))
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app), httponly=self.get_cookie_httponly(app))
+            return
+
+        now = datetime.utcnow()
+        ttl = timedelta(seconds=app.config.get('SESSION_IDLE_TTL', 14 * 24 * 3600))
+        if session.modified or session.token is None:
+            if session.token is None:
+                session.token = secrets.token_urlsafe(32)
+            customer_id, cart_items = _session_summary(session)
+            store.save(_session_id(session.token), self.serializer.dumps(dict(session)), customer_id, cart_items,
+                       now, now + ttl)
+        elif session.expires_at - now < ttl / 2:
+            store.touch(_session_id(session.token), now, now + ttl)
+        else:
+            return  # Cookie already set and still valid
+
+        response.set_cookie(name, session.token, expires=self.get_expiration_time(app, session),
+                            httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+
+
+def _session_id(token):
+    # Only a hash of the cookie is stored, so a leaked session table can't be replayed as cookies
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _session_summary(session):
+    """(customer_id, total cart quantity) for the indexed columns used by cart sharing and analytics."""
+    customer_id = None
+    if session.get('_user_id'):
+        model, pk = parse_user_id(session['_user_id'])
+        if model is Customer:
+            customer_id = pk
+    cart = session.get('cart') or {}
+    return customer_id, sum(quantity for quantity in cart.values() if isinstance(quantity, int))
+
+
+def regenerate_session(session):
+    """Moves the session's contents to a new token and deletes the old one from the store.
+
+    Called on login and logout, so a token planted in the browser (or seen) beforehand is useless afterwards.
+    """
+    if session.token is not None:
+        get_session_store().delete(_session_id(session.token))
+        session.token = None
+    session.modified = True
+
+
+def adopt_saved_cart(session, customer_id):
+    """Gives a session without a cart the customer's most recent cart from another device or browser."""
+    if session.get('cart'):
+        return
+    data = get_session_store().latest_cart_data(customer_id, datetime.utcnow())
+    if data is not None:
+        cart = session_json_serializer.loads(data).get('cart')
+        if cart:
+            session['cart'] = cart
+
+
+def init_sessions(app):
+    app.session_interface = ServerSideSessionInterface()
+
+
+@sessions_cli.command('compact')
+def compact_command():
+    """Delete expired sessions from the store."""
+    removed = get_session_store().compact(datetime.utcnow())
+    click.echo(f'Removed {removed} expired sessions.')
+
+
+@sessions_cli.command('stats')
+@click.option('--idle-hours', default=24, show_default=True, help='Count carts untouched for this long as idle.')
+def stats_command(idle_hours):
+    """Show live sessions, carts, and idle (abandoned) carts."""
+    now = datetime.utcnow()
+    stats = get_session_store().stats(now, now - timedelta(hours=idle_hours))
+    click.echo(f"{stats['sessions']} live sessions, {stats['carts']} with a cart, "
+               f"{stats['idle_carts']} carts idle for {idle_hours}h or more.")
@@ -1,48 +1,43 @@
-from datetime import timedelta, datetime
+from datetime import timedelta, datetime, date
 import sqlalchemy
-from sqlalchemy import func
-from sqlalchemy.orm import joinedload
-from flask import Blueprint, render_template, session, flash, redirect, url_for, request, abort
+from sqlalchemy import func, select
+from flask import Blueprint, render_template, session, flash, redirect, url_for, request, abort, jsonify, \
+    Response, stream_with_context
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 from . import db
 from .auth import customer_required, restaurant_required
 from .models import BaseUser, Customer, Restaurant, MenuItem, OrderItem, Order, Review
-from flask_socketio import emit
+from .ratings import record_review
+from .search import search_restaurant_ids, rank_order, index_restaurant
+from .pagination import Page, keyset_paginate, page_size_arg, decode_cursor, InvalidCursor
+from .geo import restaurants_within, nearest_restaurants, haversine_km, locate
+from .featured import featured_restaurants
+from .cards import refresh_card_fields
+from .catalogue import bump_content_version, content_state, catalogue_state, restaurant_detail
+from .conditional import conditional_response
+from .cart import current_cart
+from .orders import ORDER_STATUSES, place_order, order_for_key, new_idempotency_key, change_order_status
+from .outbox import wake_dispatcher
+from .identity import invalidate_identity
+from .reports import revenue_report
+from .exports import EXPORT_FORMATS, order_line_rows, export_chunks
+from .categories import category_names, active_category_names, is_valid_category, record_category_change, \
+    invalidate_categories
 
 views = Blueprint('views', __name__)
 
+MAX_NEAREST = 200  # Restaurants considered when sorting by distance without a radius
+
 
 @views.route('/')
 def home():
-    from flask import request
-    query = Restaurant.query
-
-    # --- Filtering ---
-    category = request.args.get('category')
-
-    categories = db.session.query(Restaurant.category).distinct().with_entities(Restaurant.category).all()
-    categories = [category[0] for category in categories]
+    categories = active_category_names()
 
-    if category and category in categories:
-        query = query.filter_by(category=category)
+    # Served from the in-memory featured pool; searches and category links go to browse_restaurants
+    featured = featured_restaurants().get()
 
-    search_query = request.args.get('search')
-    if search_query:
-        query = query.filter(Restaurant.name.ilike(f'%{search_query}%'))
-
-    # --- Sorting ---
-    sort_by = request.args.get('sort_by', 'name')
-    if sort_by == 'rating':
-        query = query.order_by(Restaurant.average_rating.desc())
-    else:
-        query = query.order_by(Restaurant.name)
-
-    featured_restaurants = Restaurant.query.order_by(func.random()).limit(3).all()  # Select 3 random restaurants
-
-    restaurants = query.all()
-
-    return render_template('home.html', featured_restaurants=featured_restaurants)
+    return render_template('home.html', featured_restaurants=featured, categories=categories)
 
 
 @views.route('/customer/dashboard')
@@ -67,9 +62,11 @@ def membership_signup():
             return render_template('membership_signup.html')
 
             # Update customer's membership details
-        current_user.membership = True
-        current_user.membership_type = membership_type
+        customer = db.session.get(Customer, current_user.customer_id)
+        customer.membership = True
+        customer.membership_type = membership_type
         db.session.commit()
+        invalidate_identity(customer)
 
         flash('Congratulations! You are now a member.', category='success')
         return redirect(url_for('views.customer_dashboard'))
@@ -81,8 +78,65 @@ def membership_signup():
 @login_required
 @customer_required
 def customer_orders():
-    orders = Order.query.filter_by(customer_id=current_user.customer_id).all()
-    return render_template('customer_orders.html', orders=orders)
+    try:
+        page = _order_history_page(current_user.customer_id, request.args)
+    except InvalidCursor:
+        abort(400)
+
+    next_url = None
+    if page.next_cursor:
+        next_url = url_for('views.customer_orders', **dict(request.args.items(), cursor=page.next_cursor))
+    return render_template('customer_orders.html', orders=page.items, next_url=next_url)
+
+
+@views.route('/api/customer/orders')
+@login_required
+@customer_required
+def api_customer_orders():
+    try:
+        page = _order_history_page(current_user.customer_id, request.args)
+    except InvalidCursor:
+        return jsonify(error='Invalid cursor.'), 400
+
+    return jsonify(
+        orders=[{
+            'order_id': row.id,
+            'created_at': row.created_at.isoformat(),
+            'restaurant_id': row.restaurant_id,
+            'restaurant_name': row.restaurant_name,
+            'item_count': row.item_count,
+            'total_price': row.total_price,
+            'status': row.status,
+        } for row in page.items],
+        next_cursor=page.next_cursor,
+    )
+
+
+def _order_history_page(customer_id, args):
+    """One page of the customer's orders, newest first, with restaurant names and item counts in the same query."""
+    item_count = select(func.coalesce(func.sum(OrderItem.quantity), 0)) \
+        .where(OrderItem.order_id == Order.id) \
+        .scalar_subquery()
+    query = db.session.query(Order.id, Order.created_at, Order.total_price, Order.status, Order.restaurant_id,
+                             Restaurant.name.label('restaurant_name'), item_count.label('item_count')) \
+        .join(Restaurant, Restaurant.restaurant_id == Order.restaurant_id) \
+        .filter(Order.customer_id == customer_id)
+
+    return _newest_orders_page(query, args)
+
+
+def _newest_orders_page(query, args):
+    """One keyset page of an order query, newest first, from ?cursor and limit. Raises InvalidCursor."""
+    cursor = decode_cursor(args.get('cursor'))
+    if cursor is not None:
+        try:
+            # Cursors carry created_at as an ISO string; compare against a datetime, as the column expects
+            cursor = [datetime.fromisoformat(cursor[0]), int(cursor[1])]
+        except (IndexError, TypeError, ValueError):
+            raise InvalidCursor('bad order cursor')
+
+    return keyset_paginate(query, [(Order.created_at, True), (Order.id, True)],
+                           lambda row: (row.created_at.isoformat(), row.id), cursor, page_size_arg(args))
 
 
 @views.route('/order/<int:order_id>')
@@ -95,8 +149,8 @@ def view_order(order_id):
     if order.customer_id != current_user.customer_id:
         abort(403)  # Forbidden access
 
-    # Fetch order items and eagerly load associated menu items
-    order_items = OrderItem.query.options(joinedload(OrderItem.menu_item)).filter_by(order_id=order_id).all()
+    # Lines carry their own name and price snapshot, so no menu_items join is needed
+    order_items = OrderItem.query.filter_by(order_id=order_id).all()
 
     return render_template('order_details.html', order=order, order_items=order_items, user=current_user)
 
@@ -105,139 +159,231 @@ def view_order(order_id):
 @login_required
 @customer_required
 def browse_restaurants():
-    from flask import request
-    from test_data import food_categories
-    query = Restaurant.query
-
-    # --- Filtering ---
-    category_filter = request.args.get('category')
-    search_query = request.args.get('search')
-
-    categories = [row[0] for row in db.session.query(Restaurant.category).distinct().all()]  # Get unique categories
-
-    # 1. Apply search filter
-    if search_query and search_query.strip():
-        query = query.filter(Restaurant.name.ilike(f'%{search_query}%'))
+    origin = _customer_origin()
 
-    # 2. Apply category filter
-    if category_filter:
-        query = query.filter_by(category=category_filter)
+    # Answer 304 from two index lookups when nothing in the catalogue changed since the client's copy
+    last_modified, restaurant_count = catalogue_state()
+    validator = ('browse', last_modified, restaurant_count, _viewer(), origin,
+                 sorted(request.args.items(multi=True)))
+    return conditional_response(validator, last_modified, lambda: _render_browse_restaurants(origin))
 
-        # --- Sorting ---
-    sort_by = request.args.get('sort_by', 'name')
-    if sort_by == 'rating':
-        query = query.order_by(Restaurant.average_rating.desc())
-    else:
-        query = query.order_by(Restaurant.name)
 
-    restaurants = query.options(joinedload(Restaurant.menu_items)).all()
+def _render_browse_restaurants(origin):
+    category_filter = request.args.get('category')
+    query = Restaurant.query  # Cards render from the restaurant row alone (see cards.py)
 
-    for restaurant in restaurants:
-        average_rating = 0
-        # Filter reviews based on orders belonging to the restaurant
-        reviews = Review.query.join(Order).filter(Order.restaurant_id == restaurant.restaurant_id).all()
-        if reviews:
-            total_rating = sum(review.rating for review in reviews)
-            average_rating = total_rating / len(reviews)
-        restaurant.average_rating = average_rating  # Add average_rating to restaurant object # Add average_rating to restaurant object
+    try:
+        page, sort_by = _restaurant_listing(query, request.args, origin)
+    except InvalidCursor:
+        abort(400)
+    restaurants = page.items
 
     # --- Check if any restaurants were found ---
     if not restaurants and category_filter:  # Check if no restaurants are found for the selected category
         flash('No restaurants found matching that category.', category='warning')
-        restaurants = Restaurant.query.all()  # Display all restaurants if there were no filters
+        page, sort_by = _restaurant_listing(query, {})  # Display all restaurants if there were no filters
+        restaurants = page.items
         category_filter = None  # Clear selected_category if no matching restaurants are found
 
+    if origin is None and (request.args.get('sort_by') == 'distance' or request.args.get('radius_km')):
+        flash('Add a full address to your profile to find restaurants near you.', category='warning')
+
+    next_url = None
+    if page.next_cursor:
+        next_url = url_for('views.browse_restaurants', **dict(request.args.items(), cursor=page.next_cursor))
+
     return render_template(
         'browse_restaurants.html',
         restaurants=restaurants,
-        categories=food_categories,
+        categories=category_names(),
         selected_category=category_filter,
+        sort_by=sort_by,
+        search_query=request.args.get('search', ''),
+        radius_km=request.args.get('radius_km', ''),
+        distances=_distances(restaurants, origin),
+        next_url=next_url,
         user=current_user
     )
 
 
-@views.route('/customer/restaurants/<int:restaurant_id>')
+@views.route('/api/restaurants')
 @login_required
 @customer_required
-def view_restaurant(restaurant_id):
-    restaurant = Restaurant.query.get_or_404(restaurant_id)
+def api_restaurants():
+    origin = _customer_origin()
+    last_modified, restaurant_count = catalogue_state()
+    validator = ('api_restaurants', last_modified, restaurant_count, _viewer(), origin,
+                 sorted(request.args.items(multi=True)))
+    return conditional_response(validator, last_modified, lambda: _api_restaurants_response(origin))
 
-    # Fetch all orders for the restaurant
-    orders = Order.query.filter_by(restaurant_id=restaurant_id).all()
 
-    # Fetch all reviews for those orders
-    order_ids = [order.id for order in orders]
-    reviews = Review.query.filter(Review.order_id.in_(order_ids)).all()
+def _api_restaurants_response(origin):
+    # Only the fields a restaurant card needs, without hydrating Restaurant or MenuItem objects
+    query = db.session.query(Restaurant.restaurant_id, Restaurant.name, Restaurant.category,
+                             Restaurant.average_rating, Restaurant.review_count,
+                             Restaurant.latitude, Restaurant.longitude, Restaurant.cover_image_path,
+                             Restaurant.menu_item_count, Restaurant.min_item_price, Restaurant.avg_item_price)
 
-    # Calculate the average rating
-    if reviews:
-        average_rating = sum(review.rating for review in reviews) / len(reviews)
+    try:
+        page, sort_by = _restaurant_listing(query, request.args, origin)
+    except InvalidCursor:
+        return jsonify(error='Invalid cursor.'), 400
+    distances = _distances(page.items, origin)
+
+    return jsonify(
+        restaurants=[{
+            'restaurant_id': row.restaurant_id,
+            'name': row.name,
+            'category': row.category,
+            'average_rating': row.average_rating,
+            'review_count': row.review_count,
+            'distance_km': round(distances[row.restaurant_id], 2) if row.restaurant_id in distances else None,
+            'image_url': url_for('static', filename=row.cover_image_path) if row.cover_image_path else None,
+            'menu_item_count': row.menu_item_count,
+            'min_item_price': row.min_item_price,
+            'avg_item_price': round(row.avg_item_price, 2) if row.avg_item_price is not None else None,
+            'url': url_for('views.view_restaurant', restaurant_id=row.restaurant_id),
+        } for row in page.items],
+        sort_by=sort_by,
+        next_cursor=page.next_cursor,
+    )
+
+
+def _restaurant_listing(query, args, origin=None):
+    """Applies the search, category, distance, sort and cursor args to a restaurant query.
+
+    origin is the customer's (latitude, longitude), if known. Returns (page, sort_by).
+    """
+    # --- Filtering ---
+    category_filter = args.get('category')
+    search_query = args.get('search')
+
+    # 1. Apply search filter (restaurant name, category and menu item text)
+    matching_ids = None
+    if search_query and search_query.strip():
+        matching_ids = search_restaurant_ids(search_query)
+        query = query.filter(Restaurant.restaurant_id.in_(matching_ids))
+
+    # 2. Apply category filter
+    if category_filter:
+        query = query.filter(Restaurant.category == category_filter)
+
+    # 3. Apply radius filter (geohash index lookup around the customer's address)
+    sort_by = args.get('sort_by', 'relevance' if matching_ids else 'name')
+    nearby_ids = None
+    radius_km = _float_arg(args, 'radius_km')
+    if origin and radius_km:
+        nearby_ids = [restaurant_id for restaurant_id, _ in restaurants_within(*origin, radius_km)]
+        query = query.filter(Restaurant.restaurant_id.in_(nearby_ids))
+    elif origin and sort_by == 'distance':
+        nearby_ids = [restaurant_id for restaurant_id, _ in nearest_restaurants(*origin, limit=MAX_NEAREST)]
+    if nearby_ids == []:
+        return Page([], None), sort_by  # Nothing in range, or no restaurant has been geocoded yet
+
+    # --- Sorting ---
+    # Every sort order ends with the primary key so the keyset cursor is unique
+    if sort_by == 'rating':
+        order = [(Restaurant.average_rating, True), (Restaurant.restaurant_id, True)]
+        key = lambda row: (row.average_rating, row.restaurant_id)
+    elif sort_by == 'price':
+        query = query.filter(Restaurant.min_item_price.isnot(None))  # Restaurants with no menu have no price
+        order = [(Restaurant.min_item_price, False), (Restaurant.restaurant_id, False)]
+        key = lambda row: (row.min_item_price, row.restaurant_id)
+    elif sort_by == 'relevance' and matching_ids:
+        order, key = _ranked_order(matching_ids)
+    elif sort_by == 'distance' and nearby_ids is not None:
+        query = query.filter(Restaurant.restaurant_id.in_(nearby_ids))
+        order, key = _ranked_order(nearby_ids)
     else:
-        average_rating = 0
+        sort_by = 'name'
+        # Imported restaurants may have no name; a NULL can't be compared against in the cursor
+        order = [(func.coalesce(Restaurant.name, ''), False), (Restaurant.restaurant_id, False)]
+        key = lambda row: (row.name or '', row.restaurant_id)
 
-    menu_items = MenuItem.query.filter_by(restaurant_id=restaurant_id).all()
-    return render_template(
-        'restaurant_details.html',
-        restaurant=restaurant,
-        menu_items=menu_items,
-        user=current_user,
-        average_rating=average_rating
-    )
+    page = keyset_paginate(query, order, key, args.get('cursor'), page_size_arg(args))
+    return page, sort_by
 
 
-@views.route('/create-order/<int:restaurant_id>', methods=['POST'])
+def _ranked_order(restaurant_ids):
+    """Keyset order and key for restaurants ranked by their position in restaurant_ids."""
+    positions = {restaurant_id: position for position, restaurant_id in enumerate(restaurant_ids)}
+    return [(rank_order(restaurant_ids), False)], lambda row: (positions[row.restaurant_id],)
+
+
+def _float_arg(args, name):
+    try:
+        return float(args.get(name) or 0) or None
+    except ValueError:
+        return None
+
+
+def _customer_origin():
+    """The current customer's geocoded location, or None."""
+    if current_user.latitude is None or current_user.longitude is None:
+        return None
+    return current_user.latitude, current_user.longitude
+
+
+def _distances(rows, origin):
+    """Distance in km from origin to each restaurant row, keyed by restaurant_id."""
+    if origin is None:
+        return {}
+    return {row.restaurant_id: haversine_km(*origin, row.latitude, row.longitude)
+            for row in rows if row.latitude is not None}
+
+
+@views.route('/customer/restaurants/<int:restaurant_id>')
 @login_required
 @customer_required
-def create_order(restaurant_id):
-    if request.method == 'POST':
-        if 'cart' not in session or not session['cart']:
-            flash('Your cart is empty.', category='error')
-            return redirect(url_for('views.view_cart'))
-
-        # 1. Get cart items and calculate total
-        cart_items = []
-        total_price = 0
-        for menu_item_id, quantity in session['cart'].items():
-            menu_item = MenuItem.query.get(menu_item_id)
-            if menu_item:
-                item_price = round(menu_item.price * quantity, 2)  # Round to 2 decimal places
-                total_price += item_price
-                cart_items.append((menu_item, quantity, item_price))
-
-        # 2. Input Validation (add more checks as needed)
-        if not cart_items:  # Double-check if cart is still empty
-            flash('Your cart is empty.', category='error')
-            return redirect(url_for('views.view_cart'))
-
-        # 3. Create and store the order (assuming no payment for now)
-        order_items = []
-        for menu_item, quantity, _ in cart_items:
-            order_item = OrderItem(menu_item_id=menu_item.id, quantity=quantity)
-            db.session.add(order_item)
-            order_items.append(order_item)
-
-        order = Order(
-            customer_id=current_user.customer_id,
-            restaurant_id=cart_items[0][0].restaurant_id,
-            items=order_items,  # Pass the list of order items
-            total_price=round(total_price, 2),
-            service_option="Membership" if current_user.membership else "Pay-on-Demand",
-            status="Pending"
+def view_restaurant(restaurant_id):
+    state = content_state(restaurant_id)
+    if state is None:
+        abort(404)
+    version, last_modified = state
+
+    def render():
+        # Cached per content version; menu, profile and review changes bump the version
+        detail = restaurant_detail(restaurant_id, version)
+        return render_template(
+            'restaurant_details.html',
+            restaurant=detail['restaurant'],
+            menu_items=detail['menu_items'],
+            user=current_user,
+            average_rating=detail['restaurant']['average_rating']
         )
 
-        db.session.add(order)
-        db.session.commit()
+    return conditional_response(('restaurant', restaurant_id, version, _viewer()), last_modified, render)
 
-        emit('new_order', {'order_id': order.id}, room=f'restaurant_{restaurant_id}', namespace='/')
 
-        # Clear the cart after order placement
-        session.pop('cart', None)
+@views.route('/api/restaurants/<int:restaurant_id>/menu')
+@login_required
+@customer_required
+def api_restaurant_menu(restaurant_id):
+    state = content_state(restaurant_id)
+    if state is None:
+        return jsonify(error='Restaurant not found.'), 404
+    version, last_modified = state
 
-        # 4. Flash message and redirection
-        flash('Order placed successfully!', 'success')
-        return redirect(url_for('views.order_confirmation', order_id=order.id))
+    def render():
+        detail = restaurant_detail(restaurant_id, version)
+        menu_items = [dict(item, image_url=url_for('static', filename=item['image_path'])
+                           if item['image_path'] else None) for item in detail['menu_items']]
+        return jsonify(restaurant=detail['restaurant'], menu_items=menu_items, version=version)
+
+    # Not user-specific, so the validator is just the content version
+    return conditional_response(('menu', restaurant_id, version), last_modified, render)
 
-    # ... (GET request handling for displaying the checkout page is the same as before)
+
+def _viewer():
+    """Identifies the signed-in user for validators of pages that show their name in the navbar."""
+    return current_user.get_id(), current_user.name
+
+
+@views.route('/create-order/<int:restaurant_id>', methods=['POST'])
+@login_required
+@customer_required
+def create_order(restaurant_id):
+    return _place_order_from_cart()
 
 
 @views.route('/add_to_cart/<int:menu_item_id>', methods=['POST'])
@@ -292,20 +438,11 @@ def remove_from_cart(menu_item_id):
 @login_required
 @customer_required
 def view_cart():
-    cart_items = []
-    total_price = 0
-
-    if 'cart' in session and session['cart']:
-        for menu_item_id, quantity in session['cart'].items():
-            menu_item = MenuItem.query.get(menu_item_id)
-            if menu_item:
-                item_price = menu_item.price * quantity
-                total_price += item_price
-                cart_items.append((menu_item, quantity, item_price))
-    else:
+    cart = current_cart(current_user)
+    if cart.is_empty:
         # Empty cart handling for GET request in view_cart route
         flash('Your cart is empty.', category='error')
-    return render_template('cart.html', cart_items=cart_items, total_price=total_price, user=current_user)
+    return render_template('cart.html', cart=cart, user=current_user)
 
 
 @views.route('/checkout', methods=['GET', 'POST'])
@@ -313,78 +450,41 @@ def view_cart():
 @customer_required
 def checkout():
     if request.method == 'POST':
-        if 'cart' in session and session['cart']:
-            # 1. Get cart items and calculate total
-            cart_items = []
-            total_price = 0
-            for menu_item_id, quantity in session['cart'].items():
-                menu_item = MenuItem.query.get(menu_item_id)
-                if menu_item:
-                    item_price = menu_item.price * quantity
-                    total_price += item_price
-                    cart_items.append((menu_item, quantity, item_price))
-
-            # 2. Input Validation
-            if not cart_items:
-                flash('Your cart is empty.', category='error')
-                return redirect(url_for('views.view_cart'))
-
-            # 3. Create and store the order
-            try:
-                # Create order items first
-                order_items = []
-                for menu_item, quantity, _ in cart_items:
-                    order_item = OrderItem(order_id=None, menu_item_id=menu_item.id,
-                                           quantity=quantity)  # order_id is None
-                    db.session.add(order_item)
-                    order_items.append(order_item)
-
-                if current_user.membership:
-                    total_price *= 0.9
-
-                order = Order(
-                    customer_id=current_user.customer_id,
-                    restaurant_id=cart_items[0][0].restaurant_id,
-                    items=order_items,
-                    total_price=total_price,
-                    service_option="Membership" if current_user.membership else "Pay-on-Demand",
-                    status="Pending"
-                )
-                db.session.add(order)
-                db.session.flush()
+        return _place_order_from_cart()
 
-                # Now the order has an ID, update the order items
-                for order_item in order_items:
-                    order_item.order_id = order.id
+    else:  # GET request
+        cart = current_cart(current_user)
+        if cart.is_empty:
+            flash('Your cart is empty.', category='error')
 
-                db.session.commit()
+        return render_template('checkout.html', cart=cart, idempotency_key=new_idempotency_key(),
+                               user=current_user)
 
-                # Clear the cart after successful order placement
-                session.pop('cart', None)
 
-            except sqlalchemy.exc.IntegrityError as e:
-                db.session.rollback()
-                flash('An error occurred while placing your order. Please try again.', category='error')
-                return redirect(url_for('views.checkout'))  # redirect back to checkout in case of errors
+def _place_order_from_cart():
+    """Places the current customer's cart as an order; a resubmitted checkout form returns the same order."""
+    idempotency_key = request.form.get('idempotency_key')
+    # A retry of a submit that went through finds the cart already cleared, so look for its order first
+    existing = order_for_key(current_user.customer_id, idempotency_key) if idempotency_key else None
+    if existing is not None:
+        return redirect(url_for('views.view_order', order_id=existing.id))
 
-        # 4. Redirect after order creation (successful or not)
+    cart = current_cart(current_user)
+    if cart.is_empty:
+        flash('Your cart is empty.', category='error')
         return redirect(url_for('views.view_cart'))
 
-    else:  # GET request
-        cart_items = []
-        total_price = 0
-        if 'cart' in session and session['cart']:
-            # Calculate the total price and prepare cart items (as before)
-            for menu_item_id, quantity in session['cart'].items():
-                menu_item = MenuItem.query.get(menu_item_id)
-                if menu_item:
-                    item_price = menu_item.price * quantity
-                    total_price += item_price
-                    cart_items.append((menu_item, quantity, item_price))
-        else:
-            flash('Your cart is empty.', category='error')
-
-        return render_template('checkout.html', cart_items=cart_items, total_price=total_price, user=current_user)
+    try:
+        order, created = place_order(current_user.customer_id, cart, idempotency_key)
+    except sqlalchemy.exc.IntegrityError:
+        flash('An error occurred while placing your order. Please try again.', category='error')
+        return redirect(url_for('views.checkout'))  # redirect back to checkout in case of errors
+
+    # Clear the cart after successful order placement
+    session.pop('cart', None)
+    if created:
+        flash('Order placed successfully!', 'success')
+    return redirect(url_for('views.view_order', order_id=order.id))
 
 
 @views.route('/submit_feedback/<int:order_id>', methods=['GET', 'POST'])
@@ -407,6 +507,8 @@ def submit_feedback(order_id):
         else:
             review = Review(order_id=order_id, rating=rating, comment=comment)
             db.session.add(review)
+            record_review(order.restaurant_id, rating)  # Same transaction as the review itself
+            bump_content_version(order.restaurant_id)
             db.session.commit()
             flash('Thank you for your feedback!', 'success')
             return redirect(url_for('views.customer_orders'))  # Redirect to order history
@@ -421,7 +523,10 @@ def restaurant_dashboard():
     print(session.get('user_type'))
     print(type(current_user))  # Add this line
     restaurant = Restaurant.query.get_or_404(current_user.restaurant_id)
-    pending_orders = Order.query.filter_by(restaurant_id=restaurant.restaurant_id, status='Pending').all()
+    pending_orders = _restaurant_orders_query(restaurant.restaurant_id) \
+        .filter(Order.status == 'Pending') \
+        .order_by(Order.created_at) \
+        .all()
     return render_template('restaurant_dashboard.html', restaurant=restaurant, pending_orders=pending_orders)
 
 
@@ -462,6 +567,10 @@ def add_menu_item():
                 new_item = MenuItem(name=name, description=description, price=price, image_path=image_path,
                                     restaurant_id=current_user.restaurant_id)
                 db.session.add(new_item)
+                index_restaurant(current_user.restaurant_id)
+                db.session.flush()
+                refresh_card_fields(current_user.restaurant_id)
+                bump_content_version(current_user.restaurant_id)
                 db.session.commit()
                 flash('Menu item added successfully!', category='success')
             except Exception as e:  # Add error handling (e.g., SQLAlchemy errors)
@@ -512,6 +621,9 @@ def edit_menu_item(item_id):
         menu_item.image_path = image_path
 
         try:
+            index_restaurant(menu_item.restaurant_id)
+            refresh_card_fields(menu_item.restaurant_id)
+            bump_content_version(menu_item.restaurant_id)
             db.session.commit()
             flash('Menu item updated successfully!', category='success')
         except Exception as e:  # Add error handling (e.g., database errors)
@@ -533,6 +645,9 @@ def delete_menu_item(item_id):
 
     try:
         db.session.delete(menu_item)
+        index_restaurant(current_user.restaurant_id)
+        refresh_card_fields(current_user.restaurant_id)
+        bump_content_version(current_user.restaurant_id)
         db.session.commit()
         flash('Menu item deleted successfully!', category='success')
     except Exception as e:  # Catch potential errors
@@ -558,30 +673,98 @@ def edit_restaurant_profile():
         phone_number = request.form.get('phone_number')
         description = request.form.get('description')
 
+        if not is_valid_category(category):
+            flash('Please choose a category from the list.', category='error')
+            return render_template('edit_restaurant_profile.html', restaurant=restaurant,
+                                   food_categories=category_names())
+
+        address_changed = address != restaurant.address
+        record_category_change(restaurant.category, category)
         restaurant.name = name
         restaurant.category = category
         restaurant.address = address
+        if address_changed:
+            locate(restaurant)
         restaurant.phone_number = phone_number
         restaurant.description = description
+        index_restaurant(restaurant.restaurant_id)
+        bump_content_version(restaurant.restaurant_id)
         db.session.commit()
+        invalidate_categories()
+        invalidate_identity(restaurant)
 
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('views.restaurant_dashboard'))
 
-    return render_template('edit_restaurant_profile.html', restaurant=restaurant)
+    return render_template('edit_restaurant_profile.html', restaurant=restaurant, food_categories=category_names())
 
 
 @views.route('/restaurant/orders')
 @login_required
 @restaurant_required
 def restaurant_orders():
-    # Retrieve all orders for the restaurant
-    restaurant = Restaurant.query.get(current_user.restaurant_id)
-    orders = Order.query.filter_by(restaurant_id=restaurant.restaurant_id) \
-        .order_by(Order.created_at.desc()) \
-        .all()
+    """The restaurant's orders, newest first, a page at a time, filtered by ?status, start_date and end_date."""
+    status = request.args.get('status') or None
+    if status is not None and status not in ORDER_STATUSES:
+        abort(400)
+    first_day, last_day = _date_range_args(request.args)
+
+    query = _restaurant_orders_query(current_user.restaurant_id)
+    if status is not None:
+        query = query.filter(Order.status == status)
+    if first_day is not None:
+        query = query.filter(Order.created_at >= datetime.combine(first_day, datetime.min.time()))
+    if last_day is not None:
+        query = query.filter(Order.created_at < datetime.combine(last_day + timedelta(days=1), datetime.min.time()))
+
+    try:
+        page = _newest_orders_page(query, request.args)
+    except InvalidCursor:
+        abort(400)
+
+    next_url = None
+    if page.next_cursor:
+        next_url = url_for('views.restaurant_orders', **dict(request.args.items(), cursor=page.next_cursor))
+    # Carried over to the export links; empty values (e.g. 'All statuses') mean no filter
+    filters = {name: value for name, value in request.args.items()
+               if name in ('status', 'start_date', 'end_date') and value}
+    return render_template('restaurant_orders.html', orders=page.items, next_url=next_url, statuses=ORDER_STATUSES,
+                           filters=filters)
+
+
+def _restaurant_orders_query(restaurant_id):
+    """The restaurant's orders with each customer's name joined in, rather than lazy-loaded row by row."""
+    return db.session.query(Order.id, Order.created_at, Order.total_price, Order.status,
+                            Customer.name.label('customer_name')) \
+        .join(Customer, Customer.customer_id == Order.customer_id) \
+        .filter(Order.restaurant_id == restaurant_id)
+
+
+def _date_range_args(args):
+    """(first_day, last_day) from ?start_date and end_date (ISO dates, either may be absent); 400 if malformed."""
+    try:
+        return [date.fromisoformat(args[name]) if args.get(name) else None for name in ('start_date', 'end_date')]
+    except ValueError:
+        abort(400)
+
 
-    return render_template('restaurant_orders.html', orders=orders)
+@views.route('/restaurant/orders/export')
+@login_required
+@restaurant_required
+def export_restaurant_orders():
+    """Streams the restaurant's orders and their lines as CSV or JSONL, filtered by ?start_date, end_date and status."""
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        abort(400)
+    first_day, last_day = _date_range_args(request.args)
+    statuses = [status for status in request.args.getlist('status') if status]  # 'status=' means any status
+    if any(status not in ORDER_STATUSES for status in statuses):
+        abort(400)
+
+    rows = order_line_rows(current_user.restaurant_id, first_day, last_day, statuses)
+    filename = f'orders-{current_user.restaurant_id}.{export_format}'
+    return Response(stream_with_context(export_chunks(export_format, rows)), mimetype=EXPORT_FORMATS[export_format],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
 
 
 @views.route('/restaurant/order/<int:order_id>')
@@ -614,8 +797,9 @@ def accept_order(order_id):
     if order.restaurant_id != current_user.restaurant_id:
         abort(403)  # Forbidden access
 
-    order.status = 'Accepted'
+    change_order_status(order, 'Accepted')
     db.session.commit()
+    wake_dispatcher()
     flash('Order accepted successfully!', category='success')
     return redirect(url_for('views.restaurant_dashboard'))
 
@@ -630,8 +814,9 @@ def reject_order(order_id):
     if order.restaurant_id != current_user.restaurant_id:
         abort(403)  # Forbidden access
 
-    order.status = 'Rejected'
+    change_order_status(order, 'Rejected')
     db.session.commit()
+    wake_dispatcher()
     flash('Order rejected.', category='warning')
     return redirect(url_for('views.restaurant_dashboard'))
 
@@ -648,8 +833,9 @@ def update_order_status(order_id):
 
     new_status = request.form.get('new_status')
     if new_status in ['Accepted', 'In Preparation', 'Out for Delivery', 'Delivered', 'Cancelled', 'Complete']:
-        order.status = new_status
+        change_order_status(order, new_status)
         db.session.commit()
+        wake_dispatcher()
         flash('Order status updated successfully!', category='success')
     else:
         flash('Invalid order status.', category='error')
@@ -666,25 +852,13 @@ def restaurant_reports():
                                   type=datetime.fromisoformat)
     end_date = request.args.get('end_date', default=datetime.utcnow(), type=datetime.fromisoformat)
 
-    orders = Order.query.filter(Order.restaurant_id == current_user.restaurant_id,
-                                Order.created_at >= start_date,
-                                Order.created_at <= end_date).all()
-
-    total_revenue = sum(order.total_price for order in orders)
-
-    revenue_by_item = db.session.query(
-        MenuItem.name,
-        func.sum(OrderItem.quantity * MenuItem.price).label('revenue')
-    ).join(OrderItem).join(Order) \
-        .filter(Order.restaurant_id == current_user.restaurant_id,
-                Order.created_at >= start_date,
-                Order.created_at <= end_date) \
-        .group_by(MenuItem.name) \
-        .all()
+    # Read from the daily rollups: one row per day (and item) instead of every order in the window
+    totals, revenue_by_item = revenue_report(current_user.restaurant_id, start_date.date(), end_date.date())
 
     return render_template(
         'restaurant_reports.html',
-        total_revenue=total_revenue,
+        total_revenue=totals['revenue'],
+        totals=totals,
         revenue_by_item=revenue_by_item,
         start_date=start_date,
         end_date=end_date